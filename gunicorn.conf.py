@@ -0,0 +1,24 @@
+"""
+Gunicorn settings for tesla_vis
+Workers import the app without side effects; ingestion starts in a post-fork hook once each worker is up
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5001')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+
+# Threaded workers: each open /api/stream connection holds a thread, not a whole worker
+worker_class = 'gthread'
+threads = 32
+
+# Set to false when ingestion runs as its own service (python tesla_vis.py ingest)
+INGESTION_AUTOSTART = os.environ.get('INGESTION_AUTOSTART', 'true').lower() != 'false'
+
+def post_worker_init(worker):
+    """Cap live streams by this worker's threads, then join the ingestion leader election after the fork"""
+    import tesla_vis
+    # An open stream holds its thread for up to STREAM_MAX_SECONDS; without headroom they could take them all
+    tesla_vis.limit_stream_clients(worker.cfg.threads)
+    if INGESTION_AUTOSTART:
+        tesla_vis.start_ingestion_services()
@@ -1,10 +1,84 @@
-from tesla_vis import app, db
+import sys
+from sqlalchemy import inspect, text
+from tesla_vis import app, db, backfill_state_codes, rebuild_rollups, rebuild_sessions, rebuild_stats, STATE_CODE_COLUMNS, TeslaData
+
+# Columns added for run-length compaction of unchanged samples
+RUN_LENGTH_COLUMNS = ['valid_until', 'last_data_id', 'sample_count', 'content_hash']
+
+def add_missing_columns(names):
+    """ALTER TABLE tesla_data for the named model columns it lacks; returns the ones added"""
+    existing = {column['name'] for column in inspect(db.engine).get_columns('tesla_data')}
+    added = [name for name in names if name not in existing]
+    with db.engine.begin() as connection:
+        for name in added:
+            column_type = TeslaData.__table__.c[name].type.compile(dialect=db.engine.dialect)
+            connection.execute(text(f'ALTER TABLE tesla_data ADD COLUMN {name} {column_type}'))
+            print(f"Added column tesla_data.{name}")
+    return added
 
 def init_database():
     with app.app_context():
         # Create all database tables
         db.create_all()
+        # create_all skips tables that already exist: add the columns introduced later (idempotent), then their indexes
+        if add_missing_columns(list(STATE_CODE_COLUMNS)):
+            backfill_state_codes()
+        add_missing_columns(RUN_LENGTH_COLUMNS)
+        for index in TeslaData.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
         print("Database tables created successfully!")
 
+def rebuild_rollup_tables():
+    with app.app_context():
+        db.create_all()
+        rebuild_rollups()
+
+def migrate_state_codes():
+    with app.app_context():
+        # One-off: add the state code columns to an existing tesla_data table and fill them in
+        add_missing_columns(list(STATE_CODE_COLUMNS))
+        for index in TeslaData.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+        backfill_state_codes()
+
+def migrate_run_columns():
+    with app.app_context():
+        # One-off: add the run-length columns to an existing tesla_data table; existing rows stay single samples
+        add_missing_columns(RUN_LENGTH_COLUMNS)
+
+def rebuild_session_table():
+    with app.app_context():
+        db.create_all()
+        rebuild_sessions()
+
+def rebuild_stats_table():
+    with app.app_context():
+        db.create_all()
+        stats = rebuild_stats()
+        db.session.commit()
+        print(f"Stats rebuilt: {stats.record_count} records, {stats.first_timestamp} to {stats.last_timestamp}")
+
 if __name__ == '__main__':
-    init_database() 
\ No newline at end of file
+    command = sys.argv[1].lower() if len(sys.argv) > 1 else 'init'
+
+    if command == 'init':
+        init_database() # Force redeploy
+    elif command == 'migrate-state-codes':
+        migrate_state_codes()
+    elif command == 'migrate-runs':
+        migrate_run_columns()
+    elif command == 'rebuild-rollups':
+        rebuild_rollup_tables()
+    elif command == 'rebuild-sessions':
+        rebuild_session_table()
+    elif command == 'rebuild-stats':
+        rebuild_stats_table()
+    else:
+        print("Usage:")
+        print("  python init_db.py                     # Create database tables, add missing columns and indexes")
+        print("  python init_db.py migrate-state-codes # Add and fill the integer state code columns")
+        print("  python init_db.py migrate-runs        # Add the run-length compaction columns")
+        print("  python init_db.py rebuild-rollups     # Recompute minute/hour/day rollups from raw data")
+        print("  python init_db.py rebuild-sessions    # Rebuild drive/charge/sleep/idle sessions from raw data")
+        print("  python init_db.py rebuild-stats       # Recount rows and time span of the stored data")
+        sys.exit(1)
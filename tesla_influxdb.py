@@ -5,48 +5,232 @@ Handles time series data storage for Tesla metrics
 """
 
 import os
+import json
+import math
+import queue
+import threading
+import time
+from collections import deque
 from datetime import datetime, timezone
-from influxdb_client import InfluxDBClient, Point
+import numpy as np
+from influxdb_client import Dialect, InfluxDBClient, Point
 from influxdb_client.client.write_api import SYNCHRONOUS
+from influxdb_client.rest import ApiException
+from tesla_vis_http import RETRY_STATUSES, backoff_delay
+from tesla_vis_series import to_json_list
 import logging
 
+# Batched writes: points per request, seconds before a partial batch is sent, and the most points held in memory
+INFLUXDB_BATCH_SIZE = int(os.environ.get('INFLUXDB_BATCH_SIZE', '500'))
+INFLUXDB_FLUSH_SECONDS = float(os.environ.get('INFLUXDB_FLUSH_SECONDS', '1'))
+INFLUXDB_BUFFER_SIZE = int(os.environ.get('INFLUXDB_BUFFER_SIZE', '10000'))
+INFLUXDB_WRITE_RETRIES = int(os.environ.get('INFLUXDB_WRITE_RETRIES', '3'))
+
+# Numeric fields served by get_history_data
+HISTORY_FIELDS = [
+    'battery_level', 'battery_range_km', 'inside_temp_c', 'outside_temp_c', 'speed_kmh', 'odometer_km',
+    'charge_rate_kmh', 'charger_power_kw', 'tpms_fl_bar', 'tpms_fr_bar', 'tpms_rl_bar', 'tpms_rr_bar',
+]
+DEFAULT_HISTORY_POINTS = 1000
+
+# History is read as plain CSV rows (a header per table, no annotation rows) and decoded per column
+PLAIN_CSV = Dialect(header=True, annotations=[])
+
+def flux_string(value):
+    """Flux string literal (same escaping as JSON for quotes and backslashes)"""
+    return json.dumps(str(value))
+
+def field_filter(fields):
+    return ' or '.join(f'r["_field"] == {flux_string(field)}' for field in fields)
+
+def decode_columns(rows, fields):
+    """Pivoted CSV rows to epoch-ms timestamps and a float64 array per field (NaN when missing)"""
+    times = []
+    texts = {field: [] for field in fields}
+    index = None
+    for row in rows:
+        if not row or not any(row):
+            continue
+        if '_time' in row and 'result' in row:
+            # Header of the next table
+            index = {name: i for i, name in enumerate(row)}
+            time_at = index['_time']
+            field_at = [(texts[field], index.get(field)) for field in fields]
+            continue
+        times.append(row[time_at])
+        for values, at in field_at:
+            values.append(row[at] if at is not None else '')
+
+    ms = np.char.rstrip(np.array(times, dtype=str), 'Z').astype('datetime64[ms]').astype(np.int64)
+    columns = {}
+    for field, values in texts.items():
+        values = np.array(values, dtype=str)
+        columns[field] = np.where(values == '', 'nan', values).astype(np.float64)
+    if len(ms) > 1 and (np.diff(ms) < 0).any():
+        # Several tables (e.g. series split by a tag) come back one after the other
+        order = np.argsort(ms, kind='stable')
+        ms = ms[order]
+        columns = {field: values[order] for field, values in columns.items()}
+    return ms, columns
+
+class BatchWriter:
+    """Bounded buffer drained by one background thread that writes in batches, retrying failed batches with backoff"""
+
+    def __init__(self, write, encode, batch_size=INFLUXDB_BATCH_SIZE, flush_interval=INFLUXDB_FLUSH_SECONDS,
+                 buffer_size=INFLUXDB_BUFFER_SIZE, retries=INFLUXDB_WRITE_RETRIES):
+        self.write = write
+        self.encode = encode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.queue = queue.Queue(maxsize=buffer_size)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.counters = {'enqueued': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'retries': 0, 'errors': 0}
+        self.latencies = deque(maxlen=200)
+
+    def count(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] += amount
+
+    def put(self, item):
+        """Queue an item without waiting; False if the buffer is full and it was dropped
+
+        Never blocks: the caller is the single spool writer, and an InfluxDB outage must not stall SQL ingestion.
+        """
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.count('dropped')
+            return False
+        self.count('enqueued')
+        return True
+
+    def next_batch(self):
+        """Wait for an item, then collect up to batch_size more for at most flush_interval"""
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            try:
+                self.write_batch([self.encode(item) for item in batch])
+            except Exception as e:
+                self.count('errors')
+                self.count('dropped', len(batch))
+                print(f"[{datetime.now()}] InfluxDB batch of {len(batch)} points dropped: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def write_batch(self, records):
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                self.write(records)
+            except ApiException as e:
+                # Rejected points (400, 401, 404, 413) fail the same way every time
+                if e.status not in RETRY_STATUSES or attempt == self.retries:
+                    raise
+            except Exception:
+                if attempt == self.retries:
+                    raise
+            else:
+                with self.lock:
+                    self.latencies.append(time.perf_counter() - start)
+                    self.counters['batches'] += 1
+                    self.counters['written'] += len(records)
+                return
+            self.count('retries')
+            time.sleep(backoff_delay(attempt))
+
+    def flush(self, timeout=10):
+        """Wait until every queued item has been written or dropped; False on timeout"""
+        deadline = time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stats(self):
+        """Counters, buffered points and recent batch write latency percentiles in ms"""
+        with self.lock:
+            counters = dict(self.counters)
+            latencies = sorted(self.latencies)
+        latency = None
+        if latencies:
+            pick = lambda q: round(latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000, 1)
+            latency = {'p50': pick(0.5), 'p95': pick(0.95), 'max': pick(1.0), 'samples': len(latencies)}
+        return dict(counters, buffered=self.queue.qsize(), latency_ms=latency)
+
 class TeslaInfluxDB:
     def __init__(self):
         self.url = os.environ.get('INFLUXDB_URL', 'http://localhost:8086')
         self.token = os.environ.get('INFLUXDB_TOKEN', 'tesla_token_123456')
         self.org = os.environ.get('INFLUXDB_ORG', 'tesla_org')
         self.bucket = os.environ.get('INFLUXDB_BUCKET', 'tesla_data')
+        self.vehicle_id = os.environ.get('INFLUXDB_VEHICLE_ID', 'tesla_001')
         
         self.client = InfluxDBClient(url=self.url, token=self.token, org=self.org)
         self.write_api = self.client.write_api(write_options=SYNCHRONOUS)
         self.query_api = self.client.query_api()
+        # Background batching for enqueue_tesla_data; points are encoded to line protocol in its thread
+        self.batch_writer = BatchWriter(
+            lambda records: self.write_api.write(bucket=self.bucket, record=records),
+            lambda data: self.tesla_point(data).to_line_protocol()
+        )
         
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
     
+    def tesla_point(self, data):
+        """One sample (TeslaData.to_dict()) as a point at its own timestamp"""
+        timestamp = data.get('timestamp')
+        if not isinstance(timestamp, datetime):
+            timestamp = datetime.now(timezone.utc)
+        # data_id is a field: as a tag every sample would start a new series
+        data_id = data.get('data_id')
+        return Point("tesla_vehicle") \
+            .tag("vehicle_id", self.vehicle_id) \
+            .field("data_id", int(data_id) if data_id is not None else None) \
+            .field("battery_level", data.get('battery_level')) \
+            .field("battery_range_km", data.get('battery_range_km')) \
+            .field("inside_temp_c", data.get('inside_temp_c')) \
+            .field("outside_temp_c", data.get('outside_temp_c')) \
+            .field("speed_kmh", data.get('speed_kmh')) \
+            .field("odometer_km", data.get('odometer_km')) \
+            .field("charge_rate_kmh", data.get('charge_rate_kmh')) \
+            .field("charger_power_kw", data.get('charger_power')) \
+            .field("tpms_fl_bar", data.get('tpms_front_left_bar')) \
+            .field("tpms_fr_bar", data.get('tpms_front_right_bar')) \
+            .field("tpms_rl_bar", data.get('tpms_rear_left_bar')) \
+            .field("tpms_rr_bar", data.get('tpms_rear_right_bar')) \
+            .field("state", data.get('state', '')) \
+            .field("charging_state", data.get('charging_state', '')) \
+            .field("location", data.get('location', '')) \
+            .time(timestamp)
+
     def store_tesla_data(self, data):
-        """Store Tesla data as time series points"""
+        """Store one sample synchronously"""
         try:
-            # Create measurement point
-            point = Point("tesla_vehicle") \
-                .tag("vehicle_id", "tesla_001") \
-                .tag("data_id", str(data.get('data_id', ''))) \
-                .field("battery_level", data.get('battery_level')) \
-                .field("battery_range_km", data.get('battery_range_km')) \
-                .field("inside_temp_c", data.get('inside_temp_c')) \
-                .field("outside_temp_c", data.get('outside_temp_c')) \
-                .field("speed_kmh", data.get('speed_kmh')) \
-                .field("odometer_km", data.get('odometer_km')) \
-                .field("charge_rate_kmh", data.get('charge_rate_kmh')) \
-                .field("charger_power_kw", data.get('charger_power')) \
-                .field("tpms_fl_bar", data.get('tpms_front_left_bar')) \
-                .field("tpms_fr_bar", data.get('tpms_front_right_bar')) \
-                .field("tpms_rl_bar", data.get('tpms_rear_left_bar')) \
-                .field("tpms_rr_bar", data.get('tpms_rear_right_bar')) \
-                .field("state", data.get('state', '')) \
-                .field("charging_state", data.get('charging_state', '')) \
-                .field("location", data.get('location', '')) \
-                .time(datetime.now(timezone.utc))
+            point = self.tesla_point(data)
             
             # Write to InfluxDB
             self.write_api.write(bucket=self.bucket, record=point)
@@ -57,14 +241,20 @@ class TeslaInfluxDB:
             self.logger.error(f"Error storing data in InfluxDB: {e}")
             return False
     
-    def get_latest_data(self):
-        """Get the latest Tesla data point"""
+    def measurement_filter(self):
+        """Flux filter for this vehicle's points"""
+        return f'filter(fn: (r) => r["_measurement"] == "tesla_vehicle" and r["vehicle_id"] == {flux_string(self.vehicle_id)})'
+
+    def get_latest_data(self, fields=None, hours=1):
+        """Get the latest Tesla data point: last() of only the requested fields, one small table per field"""
         try:
             query = f'''
-            from(bucket: "{self.bucket}")
-                |> range(start: -1h)
-                |> filter(fn: (r) => r["_measurement"] == "tesla_vehicle")
+            from(bucket: {flux_string(self.bucket)})
+                |> range(start: -{int(hours)}h)
+                |> {self.measurement_filter()}
+                {f"|> filter(fn: (r) => {field_filter(fields)})" if fields else ""}
                 |> last()
+                |> keep(columns: ["_time", "_field", "_value"])
             '''
             
             result = self.query_api.query(query)
@@ -74,9 +264,10 @@ class TeslaInfluxDB:
                 data = {}
                 for table in result:
                     for record in table.records:
-                        field = record.get_field()
-                        value = record.get_value()
-                        data[field] = value
+                        data[record.get_field()] = record.get_value()
+                        # Fields stop at different times, report the newest
+                        if 'timestamp' not in data or record.get_time() > data['timestamp']:
+                            data['timestamp'] = record.get_time()
                 
                 return data
             return None
@@ -85,44 +276,48 @@ class TeslaInfluxDB:
             self.logger.error(f"Error querying InfluxDB: {e}")
             return None
     
-    def get_history_data(self, hours=24):
-        """Get historical data for charts"""
-        try:
-            query = f'''
-            from(bucket: "{self.bucket}")
-                |> range(start: -{hours}h)
-                |> filter(fn: (r) => r["_measurement"] == "tesla_vehicle")
-                |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
+    def history_query(self, hours, fields, max_points):
+        """Flux for the history of some fields, averaged in the database into at most max_points windows"""
+        window = ''
+        if max_points:
+            every = max(math.ceil(hours * 3600 / max_points), 1)
+            window = f'|> aggregateWindow(every: {every}s, fn: mean, createEmpty: false)'
+        return f'''
+            from(bucket: {flux_string(self.bucket)})
+                |> range(start: -{int(hours)}h)
+                |> {self.measurement_filter()}
+                |> filter(fn: (r) => {field_filter(fields)})
+                {window}
+                |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+                |> keep(columns: ["_time", {", ".join(flux_string(field) for field in fields)}])
             '''
-            
-            result = self.query_api.query(query)
-            
-            if result:
-                data_points = []
-                for table in result:
-                    for record in table.records:
-                        data_points.append({
-                            'timestamp': record.get_time(),
-                            'battery_level': record.values.get('battery_level'),
-                            'battery_range_km': record.values.get('battery_range_km'),
-                            'inside_temp_c': record.values.get('inside_temp_c'),
-                            'outside_temp_c': record.values.get('outside_temp_c'),
-                            'speed_kmh': record.values.get('speed_kmh'),
-                            'charge_rate_kmh': record.values.get('charge_rate_kmh'),
-                            'charger_power_kw': record.values.get('charger_power_kw'),
-                            'tpms_fl_bar': record.values.get('tpms_fl_bar'),
-                            'tpms_fr_bar': record.values.get('tpms_fr_bar'),
-                            'tpms_rl_bar': record.values.get('tpms_rl_bar'),
-                            'tpms_rr_bar': record.values.get('tpms_rr_bar'),
-                        })
-                
-                return data_points
-            return []
+
+    def get_history_data(self, hours=24, fields=None, max_points=DEFAULT_HISTORY_POINTS):
+        """Get historical data for charts as columns: epoch-ms 'timestamps' and one list per field (None when missing)
+
+        Only the requested HISTORY_FIELDS are queried; max_points=0 returns every point unaggregated.
+        """
+        fields = list(fields or HISTORY_FIELDS)
+        unknown = [field for field in fields if field not in HISTORY_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown history fields: {', '.join(unknown)}")
+        try:
+            rows = self.query_api.query_csv(self.history_query(hours, fields, max_points), dialect=PLAIN_CSV)
+            ms, columns = decode_columns(rows, fields)
+            return {'timestamps': ms.tolist(), **{field: to_json_list(values) for field, values in columns.items()}}
             
         except Exception as e:
             self.logger.error(f"Error querying historical data: {e}")
-            return []
+            return {'timestamps': [], **{field: [] for field in fields}}
     
-    def close(self):
-        """Close InfluxDB connection"""
-        self.client.close() 
\ No newline at end of file
+    def enqueue_tesla_data(self, data):
+        """Queue one sample for the batching writer; False if its buffer was full and the sample was dropped"""
+        return self.batch_writer.put(data)
+
+    def stats(self):
+        return self.batch_writer.stats()
+
+    def close(self, timeout=10):
+        """Write out queued samples, then close InfluxDB connection"""
+        self.batch_writer.flush(timeout)
+        self.client.close()
@@ -1,14 +1,44 @@
 import os
-from flask import Flask, render_template, jsonify, request
+import atexit
+from flask import Flask, render_template, jsonify, request, make_response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timedelta, timezone
+import io
+import queue
+import csv
 import json
+import zlib
+import bisect
+import hashlib
+import itertools
+import sqlite3
 import requests
-from sqlalchemy import desc, text
+from sqlalchemy import case, desc, event, func, or_, select, text, type_coerce, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import declared_attr
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 import pytz
 import threading
 import time
+from functools import wraps
+from urllib.parse import quote
 from flask_wtf.csrf import CSRFProtect
+import numpy as np
+from tesla_vis_downsample import downsample_indices
+from tesla_vis_series import CHART_BINARY_MIMETYPE, column_array, epoch_ms, expand_runs, local_labels, pack_chart_block, to_json_list
+from tesla_vis_cache import ResponseCache
+from tesla_vis_stream import Broadcaster, format_event
+from tesla_vis_http import teslafi_client
+from tesla_vis_polling import PollPolicy, next_boundary
+from tesla_vis_leader import DatabaseLease, FileLease, process_id
+from tesla_vis_spool import Spool
+from tesla_vis_fields import TESLAFI_TIMEZONE, safe_int, sample_hash, teslafi_timestamp, tesla_record_values
+from tesla_vis_states import (
+    CAR_STATE_NAMES, CHARGING_STATE_NAMES, PLUGGED_IN_STATES, SHIFT_STATE_NAMES, VEHICLE_STATE_NAMES,
+    ChargingState, ShiftState, VehicleState, state_code, state_code_default, state_code_expression
+)
 
 # Force rebuild - 2025-06-26 00:15:00
 app = Flask(__name__)
@@ -24,13 +54,27 @@ app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-i
 
 db = SQLAlchemy(app)
 
-# Initialize database on startup
-with app.app_context():
-    try:
-        db.create_all()
-        print("Database tables created successfully!")
-    except Exception as e:
-        print(f"Database initialization error: {e}")
+# SQLite: WAL so readers never wait for the writer, NORMAL sync (the ingest spool keeps uncommitted samples),
+# and a busy timeout instead of immediate "database is locked" errors
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+    'temp_store': 'MEMORY',
+    'cache_size': -16000,
+}
+
+@event.listens_for(Engine, 'connect')
+def tune_sqlite(dbapi_connection, connection_record):
+    """Apply SQLITE_PRAGMAS to every new SQLite connection"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+        cursor.close()
+
+# Importing this module has no side effects: create the schema with `python init_db.py init`,
+# and start ingestion with start_ingestion_services() (gunicorn.conf.py does it in every worker)
 
 # Unit conversion functions
 def miles_to_km(miles):
@@ -65,7 +109,7 @@ def mph_to_kmh(mph):
 class TeslaData(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     data_id = db.Column(db.Integer, unique=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     date = db.Column(db.String(50))
     state = db.Column(db.String(20))
     battery_level = db.Column(db.Float)
@@ -109,29 +153,814 @@ class TeslaData(db.Model):
     drive_number = db.Column(db.Integer)
     charge_number = db.Column(db.Integer)
     idle_number = db.Column(db.Integer)
+    # Normalized codes of the state strings above (see tesla_vis_states), filled in on insert
+    charging_state_code = db.Column(db.SmallInteger, index=True, default=state_code_default(CHARGING_STATE_NAMES, 'charging_state'))
+    shift_state_code = db.Column(db.SmallInteger, index=True, default=state_code_default(SHIFT_STATE_NAMES, 'shift_state'))
+    state_code = db.Column(db.SmallInteger, index=True, default=state_code_default(VEHICLE_STATE_NAMES, 'state'))
+    car_state_code = db.Column(db.SmallInteger, index=True, default=state_code_default(CAR_STATE_NAMES, 'car_state'))
+    # Run-length compaction: a row stands for sample_count unchanged samples, the last one at valid_until
+    # (data_id last_data_id); single samples leave valid_until and last_data_id empty
+    valid_until = db.Column(db.DateTime)
+    last_data_id = db.Column(db.Integer)
+    sample_count = db.Column(db.Integer, default=1)
+    content_hash = db.Column(db.String(16))
     
     def to_dict(self):
         """Convert to dictionary with metric units"""
-        base_dict = {c.name: getattr(self, c.name) for c in self.__table__.columns}
-        
-        # Convert to metric units
-        base_dict['battery_range_km'] = miles_to_km(self.battery_range)
-        base_dict['ideal_battery_range_km'] = miles_to_km(self.ideal_battery_range)
-        base_dict['est_battery_range_km'] = miles_to_km(self.est_battery_range)
-        base_dict['charge_miles_added_rated_km'] = miles_to_km(self.charge_miles_added_rated)
-        base_dict['inside_temp_c'] = self.inside_temp  # Already in Celsius
-        base_dict['outside_temp_c'] = self.outside_temp  # Already in Celsius
-        base_dict['driver_temp_setting_c'] = self.driver_temp_setting  # Already in Celsius
-        base_dict['passenger_temp_setting_c'] = self.passenger_temp_setting  # Already in Celsius
-        base_dict['speed_kmh'] = mph_to_kmh(self.speed)
-        base_dict['odometer_km'] = miles_to_km(self.odometer)
-        base_dict['max_range_km'] = miles_to_km(self.max_range)
-        base_dict['tpms_front_left_bar'] = psi_to_bar(self.tpms_front_left)
-        base_dict['tpms_front_right_bar'] = psi_to_bar(self.tpms_front_right)
-        base_dict['tpms_rear_left_bar'] = psi_to_bar(self.tpms_rear_left)
-        base_dict['tpms_rear_right_bar'] = psi_to_bar(self.tpms_rear_right)
-        
-        return base_dict
+        return tesla_data_dict({c.name: getattr(self, c.name) for c in self.__table__.columns})
+
+    def last_sample(self):
+        """The newest sample this row stands for"""
+        if self.valid_until is None:
+            return self
+        return RunSample(self, self.last_data_id, self.valid_until)
+
+class RunSample:
+    """A sample folded into a run row: the row's values at its own data_id and time"""
+    def __init__(self, row, data_id, timestamp):
+        self.row = row
+        self.data_id = data_id
+        self.timestamp = timestamp
+
+    def __getattr__(self, name):
+        return getattr(self.row, name)
+
+    def to_dict(self):
+        data = self.row.to_dict()
+        data['data_id'] = self.data_id
+        data['timestamp'] = self.timestamp
+        return data
+
+def run_samples(row):
+    """The samples a stored row stands for; folded ones are spread evenly up to valid_until, their times aren't kept"""
+    if not row.sample_count or row.sample_count <= 1 or row.valid_until is None:
+        return [row]
+    step = (row.valid_until - row.timestamp) / (row.sample_count - 1)
+    last = row.last_data_id or row.data_id
+    return [row] + [
+        RunSample(row, last if i == row.sample_count - 1 else None, row.timestamp + step * i)
+        for i in range(1, row.sample_count)
+    ]
+
+def tesla_data_dict(base_dict):
+    """Add metric unit fields to a dictionary of TeslaData column values"""
+    # Convert to metric units
+    base_dict['battery_range_km'] = miles_to_km(base_dict['battery_range'])
+    base_dict['ideal_battery_range_km'] = miles_to_km(base_dict['ideal_battery_range'])
+    base_dict['est_battery_range_km'] = miles_to_km(base_dict['est_battery_range'])
+    base_dict['charge_miles_added_rated_km'] = miles_to_km(base_dict['charge_miles_added_rated'])
+    base_dict['charge_rate_kmh'] = miles_to_km(base_dict['charge_rate'])  # Range added per hour
+    base_dict['inside_temp_c'] = base_dict['inside_temp']  # Already in Celsius
+    base_dict['outside_temp_c'] = base_dict['outside_temp']  # Already in Celsius
+    base_dict['driver_temp_setting_c'] = base_dict['driver_temp_setting']  # Already in Celsius
+    base_dict['passenger_temp_setting_c'] = base_dict['passenger_temp_setting']  # Already in Celsius
+    base_dict['speed_kmh'] = mph_to_kmh(base_dict['speed'])
+    base_dict['odometer_km'] = miles_to_km(base_dict['odometer'])
+    base_dict['max_range_km'] = miles_to_km(base_dict['max_range'])
+    base_dict['tpms_front_left_bar'] = psi_to_bar(base_dict['tpms_front_left'])
+    base_dict['tpms_front_right_bar'] = psi_to_bar(base_dict['tpms_front_right'])
+    base_dict['tpms_rear_left_bar'] = psi_to_bar(base_dict['tpms_rear_left'])
+    base_dict['tpms_rear_right_bar'] = psi_to_bar(base_dict['tpms_rear_right'])
+    
+    return base_dict
+
+# Code column -> (source string column, lookup table)
+STATE_CODE_COLUMNS = {
+    'charging_state_code': ('charging_state', CHARGING_STATE_NAMES),
+    'shift_state_code': ('shift_state', SHIFT_STATE_NAMES),
+    'state_code': ('state', VEHICLE_STATE_NAMES),
+    'car_state_code': ('car_state', CAR_STATE_NAMES),
+}
+
+def backfill_state_codes():
+    """Compute the state code columns of rows stored before they existed, in SQL"""
+    values = {
+        code_column: state_code_expression(names, getattr(TeslaData, source))
+        for code_column, (source, names) in STATE_CODE_COLUMNS.items()
+    }
+    result = db.session.execute(
+        update(TeslaData).where(or_(*[getattr(TeslaData, c).is_(None) for c in STATE_CODE_COLUMNS])).values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    print(f"[{datetime.now()}] State codes computed for {result.rowcount} records")
+    return result.rowcount
+
+# Numeric columns aggregated into the minute/hour/day rollup tables
+ROLLUP_COLUMNS = [c.name for c in TeslaData.__table__.columns if isinstance(c.type, db.Float)]
+
+class RollupMixin:
+    """Count/sum/min/max of one TeslaData column over one time bucket"""
+    id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.DateTime, nullable=False, index=True)
+    metric = db.Column(db.String(50), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    sum = db.Column(db.Float, nullable=False, default=0.0)
+    min = db.Column(db.Float)
+    max = db.Column(db.Float)
+
+    @declared_attr
+    def __table_args__(cls):
+        return (db.UniqueConstraint('bucket', 'metric'),)
+
+    @property
+    def avg(self):
+        return self.sum / self.count if self.count else None
+
+class TeslaRollupMinute(RollupMixin, db.Model):
+    __tablename__ = 'tesla_rollup_minute'
+
+class TeslaRollupHour(RollupMixin, db.Model):
+    __tablename__ = 'tesla_rollup_hour'
+
+class TeslaRollupDay(RollupMixin, db.Model):
+    __tablename__ = 'tesla_rollup_day'
+
+# Ordered coarse to fine so chart queries can pick the coarsest one that still fits
+ROLLUP_RESOLUTIONS = [
+    (TeslaRollupDay, timedelta(days=1)),
+    (TeslaRollupHour, timedelta(hours=1)),
+    (TeslaRollupMinute, timedelta(minutes=1)),
+]
+
+def rollup_bucket(ts, width):
+    """Start of the bucket of the given width that contains ts"""
+    return datetime.min + ((ts.replace(tzinfo=None) - datetime.min) // width) * width
+
+def update_rollups(records):
+    """Fold newly stored TeslaData records into the rollup tables (caller commits)"""
+    for model, width in ROLLUP_RESOLUTIONS:
+        # Pre-aggregate the batch so every (bucket, metric) is touched once
+        pending = {}
+        for record in records:
+            bucket = rollup_bucket(record.timestamp, width)
+            for column in ROLLUP_COLUMNS:
+                value = getattr(record, column)
+                if value is None:
+                    continue
+                agg = pending.get((bucket, column))
+                if agg is None:
+                    pending[(bucket, column)] = [1, value, value, value]
+                else:
+                    agg[0] += 1
+                    agg[1] += value
+                    agg[2] = min(agg[2], value)
+                    agg[3] = max(agg[3], value)
+
+        if not pending:
+            continue
+
+        buckets = {bucket for bucket, _ in pending}
+        existing = {
+            (row.bucket, row.metric): row
+            for row in model.query.filter(model.bucket.in_(buckets)).all()
+        }
+        inserts = []
+        for (bucket, metric), (count, total, low, high) in pending.items():
+            row = existing.get((bucket, metric))
+            if row is None:
+                inserts.append({'bucket': bucket, 'metric': metric, 'count': count, 'sum': total, 'min': low, 'max': high})
+            else:
+                row.count += count
+                row.sum += total
+                row.min = low if row.min is None else min(row.min, low)
+                row.max = high if row.max is None else max(row.max, high)
+        if inserts:
+            db.session.execute(model.__table__.insert(), inserts)
+
+def rebuild_rollups(batch_size=5000):
+    """Recompute every rollup table from the raw tesla_data rows"""
+    for model, _ in ROLLUP_RESOLUTIONS:
+        model.query.delete()
+    db.session.commit()
+
+    processed = 0
+    last_id = 0
+    while True:
+        # Keyset pagination keeps memory flat on large tables
+        batch = TeslaData.query.filter(TeslaData.id > last_id).order_by(TeslaData.id).limit(batch_size).all()
+        if not batch:
+            break
+        update_rollups([sample for row in batch for sample in run_samples(row)])
+        db.session.commit()
+        processed += len(batch)
+        last_id = batch[-1].id
+        db.session.expunge_all()
+
+    print(f"[{datetime.now()}] Rollups rebuilt from {processed} records")
+    return processed
+
+class TeslaStats(db.Model):
+    """Single-row summary of tesla_data, kept current by the ingest path instead of counting rows per request"""
+    __tablename__ = 'tesla_stats'
+    id = db.Column(db.Integer, primary_key=True)
+    record_count = db.Column(db.Integer, nullable=False, default=0)
+    first_timestamp = db.Column(db.DateTime)
+    last_timestamp = db.Column(db.DateTime)
+    latest_data_id = db.Column(db.Integer)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'record_count': self.record_count,
+            'first_timestamp': self.first_timestamp.isoformat() if self.first_timestamp else None,
+            'last_timestamp': self.last_timestamp.isoformat() if self.last_timestamp else None,
+            'latest_data_id': self.latest_data_id,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+STATS_ROW_ID = 1
+
+def update_stats(records):
+    """Add newly stored TeslaData samples to the stats row (caller commits, records must be flushed)"""
+    if not records:
+        return
+    oldest = min(record.timestamp for record in records)
+    newest = max(records, key=lambda record: record.timestamp)
+
+    # Relative update so concurrent ingests in other workers don't overwrite each other's counts
+    result = db.session.execute(
+        update(TeslaStats).where(TeslaStats.id == STATS_ROW_ID).values(
+            record_count=TeslaStats.record_count + len(records),
+            first_timestamp=case(
+                (or_(TeslaStats.first_timestamp.is_(None), TeslaStats.first_timestamp > oldest), oldest),
+                else_=TeslaStats.first_timestamp
+            ),
+            last_timestamp=case(
+                (or_(TeslaStats.last_timestamp.is_(None), TeslaStats.last_timestamp <= newest.timestamp), newest.timestamp),
+                else_=TeslaStats.last_timestamp
+            ),
+            latest_data_id=case(
+                (or_(TeslaStats.last_timestamp.is_(None), TeslaStats.last_timestamp <= newest.timestamp), newest.data_id),
+                else_=TeslaStats.latest_data_id
+            ),
+            updated_at=datetime.utcnow(),
+        ).execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        # No stats row yet, the flushed records are already part of the recount
+        rebuild_stats()
+
+def rebuild_stats():
+    """Recompute the stats row from tesla_data, counting every sample of a run (caller commits)"""
+    record_count, first_timestamp, last_timestamp = db.session.execute(
+        select(func.coalesce(func.sum(func.coalesce(TeslaData.sample_count, 1)), 0), func.min(TeslaData.timestamp),
+               func.max(func.coalesce(TeslaData.valid_until, TeslaData.timestamp)))
+    ).one()
+    latest_data_id = db.session.execute(
+        select(func.coalesce(TeslaData.last_data_id, TeslaData.data_id)).order_by(desc(TeslaData.timestamp)).limit(1)
+    ).scalar()
+
+    stats = db.session.get(TeslaStats, STATS_ROW_ID) or TeslaStats(id=STATS_ROW_ID)
+    stats.record_count = record_count
+    stats.first_timestamp = first_timestamp
+    stats.last_timestamp = last_timestamp
+    stats.latest_data_id = latest_data_id
+    stats.updated_at = datetime.utcnow()
+    db.session.add(stats)
+    return stats
+
+def get_stats():
+    """The stats row, built from tesla_data the first time it is needed"""
+    stats = db.session.get(TeslaStats, STATS_ROW_ID)
+    if stats is None:
+        stats = rebuild_stats()
+        db.session.commit()
+    return stats
+
+# TeslaFi numbers each drive/charge/sleep/idle period; a sample carries the number of the period it belongs to
+SESSION_KINDS = [
+    ('drive', 'drive_number'),
+    ('charge', 'charge_number'),
+    ('sleep', 'sleep_number'),
+    ('idle', 'idle_number'),
+]
+
+class TeslaSession(db.Model):
+    """One drive/charge/sleep/idle period built from the samples that carry its TeslaFi number"""
+    __tablename__ = 'tesla_sessions'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)
+    number = db.Column(db.Integer, nullable=False)
+    is_open = db.Column(db.Boolean, nullable=False, default=True, index=True)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    start_data_id = db.Column(db.Integer)
+    end_data_id = db.Column(db.Integer)
+    start_battery_level = db.Column(db.Float)
+    end_battery_level = db.Column(db.Float)
+    start_odometer = db.Column(db.Float)
+    end_odometer = db.Column(db.Float)
+    charge_energy_added = db.Column(db.Float)
+    max_charger_power = db.Column(db.Float)
+    sample_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'number'),
+        db.Index('ix_tesla_sessions_kind_start_time', 'kind', 'start_time'),
+    )
+
+    def to_dict(self):
+        """Convert to dictionary with metric units"""
+        distance = None
+        if self.start_odometer is not None and self.end_odometer is not None:
+            distance = self.end_odometer - self.start_odometer
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'number': self.number,
+            'is_open': self.is_open,
+            'start_time': self.start_time.isoformat(),
+            'end_time': self.end_time.isoformat(),
+            'duration_minutes': (self.end_time - self.start_time).total_seconds() / 60,
+            'start_battery_level': self.start_battery_level,
+            'end_battery_level': self.end_battery_level,
+            'distance_km': miles_to_km(distance),
+            'charge_energy_added': self.charge_energy_added,
+            'max_charger_power': self.max_charger_power,
+            'sample_count': self.sample_count,
+        }
+
+def session_key(record):
+    """(kind, TeslaFi number) of the session a sample belongs to, or None if it carries no number"""
+    for kind, column in SESSION_KINDS:
+        number = getattr(record, column)
+        if number:
+            return kind, number
+    return None
+
+def update_sessions(records):
+    """Extend or open the session of each newly stored record (caller commits)"""
+    sessions = {}
+    # The only per-vehicle state: the session that is still running
+    current = TeslaSession.query.filter_by(is_open=True).order_by(desc(TeslaSession.end_time)).first()
+    for record in sorted(records, key=lambda r: r.timestamp):
+        key = session_key(record)
+        if key is None:
+            continue
+        session = sessions.get(key)
+        if session is None:
+            session = TeslaSession.query.filter_by(kind=key[0], number=key[1]).first()
+
+        if session is None:
+            session = TeslaSession(
+                kind=key[0], number=key[1], is_open=False,
+                start_time=record.timestamp, end_time=record.timestamp,
+                start_data_id=record.data_id, end_data_id=record.data_id,
+                start_battery_level=record.battery_level, end_battery_level=record.battery_level,
+                start_odometer=record.odometer, end_odometer=record.odometer,
+                charge_energy_added=record.charge_energy_added, max_charger_power=record.charger_power,
+                sample_count=1
+            )
+            # A newer period starts and the running one has ended; late samples of old periods open nothing
+            if current is None or record.timestamp >= current.end_time:
+                if current is not None:
+                    current.is_open = False
+                session.is_open = True
+                current = session
+            db.session.add(session)
+            sessions[key] = session
+            continue
+
+        sessions[key] = session
+        session.sample_count += 1
+        # Samples can arrive out of order (backfills), so either end may move
+        if record.timestamp < session.start_time:
+            session.start_time = record.timestamp
+            session.start_data_id = record.data_id
+            session.start_battery_level = record.battery_level
+            session.start_odometer = record.odometer
+        if record.timestamp >= session.end_time:
+            session.end_time = record.timestamp
+            session.end_data_id = record.data_id
+            session.end_battery_level = record.battery_level
+            session.end_odometer = record.odometer
+        # TeslaFi reports energy added so far in the current charge, so the session total is its maximum
+        if record.charge_energy_added is not None:
+            session.charge_energy_added = max(session.charge_energy_added or 0, record.charge_energy_added)
+        if record.charger_power is not None:
+            session.max_charger_power = max(session.max_charger_power or 0, record.charger_power)
+
+def rebuild_sessions(batch_size=5000):
+    """Recompute the sessions table from the raw tesla_data rows"""
+    TeslaSession.query.delete()
+    db.session.commit()
+
+    processed = 0
+    last_id = 0
+    while True:
+        batch = TeslaData.query.filter(TeslaData.id > last_id).order_by(TeslaData.id).limit(batch_size).all()
+        if not batch:
+            break
+        update_sessions([sample for row in batch for sample in run_samples(row)])
+        db.session.commit()
+        processed += len(batch)
+        last_id = batch[-1].id
+        db.session.expunge_all()
+
+    print(f"[{datetime.now()}] Sessions rebuilt from {processed} records")
+    return processed
+
+def update_derived_tables(records):
+    """Fold newly stored (flushed) TeslaData records into rollups, stats and sessions (caller commits)"""
+    update_rollups(records)
+    update_stats(records)
+    update_sessions(records)
+
+# Chart labels are shown in the owner's local time
+SOFIA_TZ = pytz.timezone('Europe/Sofia')
+
+# Default point budget for chart responses, override per request with ?max_points= (0 disables)
+DEFAULT_CHART_MAX_POINTS = int(os.environ.get('CHART_MAX_POINTS', '1000'))
+
+def chart_max_points():
+    """Point budget requested by the client for one chart series"""
+    return request.args.get('max_points', DEFAULT_CHART_MAX_POINTS, type=int)
+
+def chart_range():
+    """Parse start/end date and time query parameters, defaulting to the last hour"""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    start_time = request.args.get('start_time', '00:00:00')
+    end_time = request.args.get('end_time', '23:59:59')
+
+    if not start_date or not end_date:
+        end_dt = datetime.now(timezone.utc)
+        return end_dt - timedelta(hours=1), end_dt
+
+    # Parse date strings and combine with time for precise filtering
+    start_dt = datetime.strptime(f"{start_date} {start_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    end_dt = datetime.strptime(f"{end_date} {end_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return start_dt, end_dt
+
+def pick_rollup(start_dt, end_dt, max_points):
+    """Coarsest rollup whose bucket width still gives max_points over the range, or None for raw rows"""
+    if not max_points:
+        return None
+    wanted = (end_dt - start_dt) / max_points
+    for model, width in ROLLUP_RESOLUTIONS:
+        if width <= wanted:
+            return model, width
+    return None
+
+# String columns stay object arrays, everything else is fetched as float64 with NaN for NULL
+STRING_COLUMNS = {c.name for c in TeslaData.__table__.columns if isinstance(c.type, db.String)}
+
+def timestamp_column(column):
+    """Select timestamps raw on SQLite: NumPy parses the stored ISO strings faster than per-row datetime conversion"""
+    if db.engine.dialect.name == 'sqlite':
+        return type_coerce(column, db.String)
+    return column
+
+def query_chart_columns(start_dt, end_dt, columns):
+    """Epoch-ms timestamps and one NumPy array per requested column, without hydrating TeslaData objects"""
+    selected = [timestamp_column(TeslaData.timestamp), timestamp_column(TeslaData.valid_until),
+                *[getattr(TeslaData, c) for c in columns]]
+    stmt = select(*selected).where(
+        TeslaData.timestamp >= start_dt,
+        TeslaData.timestamp <= end_dt
+    ).order_by(TeslaData.timestamp)
+    # Core execution: plain rows, no ORM identity map or object loading
+    connection = db.session.connection()
+    rows = connection.execute(stmt).all()
+    # Runs never overlap, so only the row just before the range can still be valid inside it
+    before = connection.execute(
+        select(*selected).where(TeslaData.timestamp < start_dt).order_by(desc(TeslaData.timestamp)).limit(1)
+    ).first()
+    start_ms, end_ms = epoch_ms([start_dt.replace(tzinfo=None), end_dt.replace(tzinfo=None)])
+    # ... and only if that run is still going at start_dt
+    if before is not None and before[1] is not None and epoch_ms([before[1]])[0] >= start_ms:
+        rows.insert(0, before)
+
+    fetched = list(zip(*rows)) or [()] * (len(columns) + 2)
+    arrays = {
+        column: column_array(values, numeric=column not in STRING_COLUMNS)
+        for column, values in zip(columns, fetched[2:])
+    }
+    return expand_runs(epoch_ms(fetched[0]), fetched[1], arrays, start_ms, end_ms)
+
+def query_rollup_columns(rollup, start_dt, end_dt, columns):
+    """Bucket-average arrays from a rollup table, pivoted to one array per column"""
+    model, width = rollup
+    stmt = select(timestamp_column(model.bucket), model.metric, model.sum, model.count).where(
+        model.bucket >= rollup_bucket(start_dt, width),
+        model.bucket <= end_dt.replace(tzinfo=None),
+        model.metric.in_(columns)
+    )
+    rows = db.session.connection().execute(stmt).all()
+    if not rows:
+        return epoch_ms([]), {column: column_array([]) for column in columns}
+
+    buckets, metrics, sums, counts = zip(*rows)
+    ms, slots = np.unique(epoch_ms(buckets), return_inverse=True)
+    metric_index = {column: i for i, column in enumerate(columns)}
+    values = np.full((len(columns), len(ms)), np.nan)
+    values[[metric_index[m] for m in metrics], slots] = np.array(sums) / np.array(counts)
+    return ms, {column: values[i] for column, i in metric_index.items()}
+
+def chart_since():
+    """Cursor held by the client: epoch ms of the newest point it already has"""
+    return request.args.get('since', type=int)
+
+def raw_cursor(start_dt, end_dt):
+    """Epoch ms of the newest raw sample in the range, for responses built from rollup buckets"""
+    newest = db.session.execute(
+        select(func.max(func.coalesce(TeslaData.valid_until, TeslaData.timestamp)))
+        .where(TeslaData.timestamp >= start_dt, TeslaData.timestamp <= end_dt)
+    ).scalar()
+    if newest is None:
+        return None
+    return int(min(epoch_ms([newest])[0], epoch_ms([end_dt.replace(tzinfo=None)])[0]))
+
+def load_chart_columns(columns, rollup_ready=False):
+    """Projected columns for the chart range (from rollups when rollup_ready allows it) and the cursor for ?since= requests"""
+    start_dt, end_dt = chart_range()
+    since = chart_since()
+    if since is not None:
+        # Incremental refresh: only raw points newer than the cursor, whatever the range start
+        start_dt = datetime.fromtimestamp((since + 1) / 1000, tz=timezone.utc)
+        ms, arrays = query_chart_columns(start_dt, end_dt, columns)
+        return ms, arrays, int(ms[-1]) if len(ms) else since
+
+    rollup = pick_rollup(start_dt, end_dt, chart_max_points()) if rollup_ready else None
+    if rollup is None:
+        ms, arrays = query_chart_columns(start_dt, end_dt, columns)
+        return ms, arrays, int(ms[-1]) if len(ms) else None
+    ms, arrays = query_rollup_columns(rollup, start_dt, end_dt, columns)
+    return ms, arrays, raw_cursor(start_dt, end_dt)
+
+def bool_to_int(values):
+    """Convert boolean flags (NaN when missing) to 0/1 for step charts"""
+    return (np.nan_to_num(values) > 0).astype(np.int64)
+
+def plugged_in_values(codes):
+    """Convert charging state codes (NaN when missing) to 0/1 for the charging chart"""
+    return np.isin(codes, PLUGGED_IN_STATES).astype(np.int64)
+
+class ChartSeries:
+    """One chart series: source column, vectorized unit conversion, null fill and series type"""
+    def __init__(self, column, convert=None, fill=None, kind='continuous'):
+        self.column = column
+        self.convert = convert
+        self.fill = fill
+        self.kind = kind
+
+    @property
+    def rollup_ready(self):
+        """Whether the series can be served from bucket averages"""
+        return self.kind == 'continuous' and self.column in ROLLUP_COLUMNS
+
+    def values(self, columns):
+        values = columns[self.column]
+        if self.convert is not None:
+            values = self.convert(values)
+        if self.fill is not None:
+            values = np.where(np.isnan(values), self.fill, values)
+        return values
+
+# Chart metric registry: /api/charts/<metric> and /api/charts?metrics=... are built from it
+CHART_METRICS = {
+    'battery': {
+        'values': ChartSeries('battery_level'),
+    },
+    'temperature': {
+        'outside': ChartSeries('outside_temp'),
+        'inside': ChartSeries('inside_temp'),
+    },
+    'charging': {
+        # Charging state (0/1), charge rate (kW), and charger power (kW)
+        'charging_state': ChartSeries('charging_state_code', convert=plugged_in_values, kind='step'),
+        'charge_rate': ChartSeries('charge_rate', fill=0),
+        'charger_power': ChartSeries('charger_power', fill=0),
+    },
+    'tire_pressure': {
+        'front_left': ChartSeries('tpms_front_left', convert=psi_to_bar),
+        'front_right': ChartSeries('tpms_front_right', convert=psi_to_bar),
+        'rear_left': ChartSeries('tpms_rear_left', convert=psi_to_bar),
+        'rear_right': ChartSeries('tpms_rear_right', convert=psi_to_bar),
+    },
+    'climate': {
+        'values': ChartSeries('is_climate_on', convert=bool_to_int, kind='step'),
+    },
+    'vehicle_state': {
+        'values': ChartSeries('locked', convert=bool_to_int, kind='step'),
+    },
+    'sentry': {
+        'values': ChartSeries('sentry_mode', convert=bool_to_int, kind='step'),
+    },
+    'valet': {
+        'values': ChartSeries('valet_mode', convert=bool_to_int, kind='step'),
+    },
+    'odometer': {
+        'values': ChartSeries('odometer', convert=miles_to_km),
+    },
+    'speed': {
+        'values': ChartSeries('speed', convert=mph_to_kmh),
+    },
+    'location': {
+        # Averaged coordinates are not real positions, so the map always uses raw samples
+        'latitudes': ChartSeries('latitude', kind='path'),
+        'longitudes': ChartSeries('longitude', kind='path'),
+    },
+    'battery_range': {
+        'battery_range': ChartSeries('battery_range', convert=miles_to_km),
+        'ideal_battery_range': ChartSeries('ideal_battery_range', convert=miles_to_km),
+        'est_battery_range': ChartSeries('est_battery_range', convert=miles_to_km),
+    },
+    'charging_details': {
+        'charge_rate': ChartSeries('charge_rate', fill=0),
+        'charger_power': ChartSeries('charger_power', fill=0),
+        'charger_voltage': ChartSeries('charger_voltage', fill=0),
+        'charger_current': ChartSeries('charger_actual_current', fill=0),
+        'time_to_full': ChartSeries('time_to_full_charge', fill=0),
+        'energy_added': ChartSeries('charge_energy_added', fill=0),
+    },
+}
+
+def chart_columns(metrics):
+    """Source columns needed by the given metrics and whether they can all come from rollups"""
+    series = [spec for metric in metrics for spec in CHART_METRICS[metric].values()]
+    columns = sorted({spec.column for spec in series})
+    return columns, all(spec.rollup_ready for spec in series)
+
+def chart_series(metric, ms, columns):
+    """Timestamps and converted series of one registered metric, downsampled to max_points"""
+    specs = CHART_METRICS[metric]
+    series = {name: spec.values(columns) for name, spec in specs.items()}
+
+    max_points = chart_max_points()
+    if max_points and len(ms) > max_points:
+        indices = downsample_indices(
+            ms,
+            continuous=[series[name] for name, spec in specs.items() if spec.kind != 'step'],
+            step=[series[name] for name, spec in specs.items() if spec.kind == 'step'],
+            max_points=max_points
+        )
+        ms = ms[indices]
+        series = {name: values[indices] for name, values in series.items()}
+    return ms, series
+
+def build_chart_data(metric, ms, columns, cursor=None):
+    """JSON series payload for one registered metric"""
+    ms, series = chart_series(metric, ms, columns)
+    return {
+        # Labels in Europe/Sofia time, formatted in bulk
+        'labels': local_labels(ms, SOFIA_TZ),
+        'timestamps': ms.tolist(),
+        'cursor': cursor,
+        **{name: to_json_list(values) for name, values in series.items()}
+    }
+
+# Seconds a worker trusts its cached data version before re-reading it (other workers may have ingested)
+DATA_VERSION_TTL = float(os.environ.get('DATA_VERSION_TTL', '5'))
+
+response_cache = ResponseCache(max_entries=int(os.environ.get('RESPONSE_CACHE_SIZE', '256')))
+data_version = {'data_id': None, 'last_modified': None, 'checked_at': None}
+data_version_lock = threading.Lock()
+
+def current_data_version():
+    """Latest (data_id, timestamp), re-read from the database at most every DATA_VERSION_TTL seconds"""
+    with data_version_lock:
+        checked_at = data_version['checked_at']
+        if checked_at is not None and time.monotonic() - checked_at < DATA_VERSION_TTL:
+            return data_version['data_id'], data_version['last_modified']
+
+    # A run's row changes when it is extended, so the version comes from its last sample
+    latest = db.session.execute(
+        select(func.coalesce(TeslaData.last_data_id, TeslaData.data_id), func.coalesce(TeslaData.valid_until, TeslaData.timestamp))
+        .order_by(desc(TeslaData.id)).limit(1)
+    ).first()
+    with data_version_lock:
+        data_version['data_id'], data_version['last_modified'] = latest if latest else (None, None)
+        data_version['checked_at'] = time.monotonic()
+        return data_version['data_id'], data_version['last_modified']
+
+def mark_data_changed(record):
+    """Called after a new TeslaData row is committed: bump the data version, drop cached responses, notify streams"""
+    with data_version_lock:
+        data_version['data_id'] = record.data_id
+        data_version['last_modified'] = record.timestamp
+        data_version['checked_at'] = time.monotonic()
+    response_cache.clear()
+    if live_updates.subscriber_count():
+        publish_sample(record.to_dict())
+
+def response_cache_key():
+    """Endpoint plus normalized query parameters; relative ranges are pinned to the current minute"""
+    args = tuple(sorted((k, v) for k, v in request.args.items(multi=True) if k != 't'))
+    # The representation can be negotiated through Accept
+    args += (('accept', request.headers.get('Accept', '')),)
+    if not (request.args.get('start_date') and request.args.get('end_date')):
+        args += (('now', datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M')),)
+    return request.path, args
+
+def conditional_get(view):
+    """ETag/Last-Modified validation and a data-version tagged response cache for read endpoints"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version, last_modified = current_data_version()
+        key = response_cache_key()
+        etag = hashlib.sha1(repr((version, key)).encode()).hexdigest()[:20]
+        last_modified = last_modified.replace(tzinfo=timezone.utc) if last_modified else None
+
+        # Matching validators: answer 304 without touching the data. If-Modified-Since is only trusted for
+        # fixed ranges, a relative range moves with the clock even when no new data arrived
+        if request.if_none_match:
+            not_modified = etag in request.if_none_match
+        else:
+            not_modified = (
+                last_modified is not None and request.if_modified_since is not None
+                and 'start_date' in request.args
+                and last_modified.replace(microsecond=0) <= request.if_modified_since
+            )
+        if not_modified:
+            response = make_response('', 304)
+        else:
+            cached = response_cache.get(key, version)
+            if cached is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200:
+                    response_cache.put(key, version, (response.get_data(), response.mimetype))
+            else:
+                body, mimetype = cached
+                response = app.response_class(body, mimetype=mimetype)
+
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        # Always revalidate, the ETag makes that cheap
+        response.cache_control.no_cache = True
+        response.vary.add('Accept')
+        return response
+    return wrapper
+
+# Live updates: one broadcaster per process feeds every /api/stream connection
+STREAM_POLL_SECONDS = float(os.environ.get('STREAM_POLL_SECONDS', '5'))
+STREAM_KEEPALIVE_SECONDS = 15
+# Streams are closed after this long and the browser reconnects, so no worker thread is pinned forever
+STREAM_MAX_SECONDS = int(os.environ.get('STREAM_MAX_SECONDS', '600'))
+STREAM_MAX_CLIENTS = int(os.environ.get('STREAM_MAX_CLIENTS', '50'))
+
+def limit_stream_clients(threads):
+    """Lower the stream cap below a server's thread count, keeping a quarter (at least 4) for ordinary requests"""
+    global STREAM_MAX_CLIENTS
+    STREAM_MAX_CLIENTS = min(STREAM_MAX_CLIENTS, max(threads - max(threads // 4, 4), 0))
+    return STREAM_MAX_CLIENTS
+
+live_updates = Broadcaster()
+live_snapshot = {'data': None}
+live_snapshot_lock = threading.Lock()
+live_poller = {'thread': None}
+
+def publish_sample(snapshot):
+    """Broadcast a newer latest sample as a delta of the fields that changed"""
+    with live_snapshot_lock:
+        previous = live_snapshot['data']
+        if previous is not None and snapshot['timestamp'] <= previous['timestamp']:
+            return
+        live_snapshot['data'] = snapshot
+
+    if previous is None:
+        delta = snapshot
+    else:
+        delta = {key: value for key, value in snapshot.items() if previous.get(key) != value}
+        delta['data_id'] = snapshot['data_id']
+        delta['timestamp'] = snapshot['timestamp']
+    live_updates.publish('delta', app.json.dumps(delta))
+
+def latest_snapshot():
+    """Latest sample as sent to stream clients, read from the database only when this process has none yet"""
+    with live_snapshot_lock:
+        if live_snapshot['data'] is not None:
+            return live_snapshot['data']
+    latest = TeslaData.query.order_by(desc(TeslaData.timestamp)).first()
+    if latest is None:
+        return None
+    snapshot = latest.last_sample().to_dict()
+    with live_snapshot_lock:
+        if live_snapshot['data'] is None or live_snapshot['data']['timestamp'] < snapshot['timestamp']:
+            live_snapshot['data'] = snapshot
+        return live_snapshot['data']
+
+def live_update_poller():
+    """Pick up samples stored by other processes; one query per interval no matter how many clients are connected"""
+    while True:
+        time.sleep(STREAM_POLL_SECONDS)
+        if not live_updates.subscriber_count():
+            continue
+        try:
+            with app.app_context():
+                latest = TeslaData.query.order_by(desc(TeslaData.timestamp)).first()
+                if latest is not None:
+                    publish_sample(latest.last_sample().to_dict())
+        except Exception as e:
+            print(f"[{datetime.now()}] Live update poller error: {e}")
+
+def ensure_live_poller():
+    with live_snapshot_lock:
+        if live_poller['thread'] is None:
+            live_poller['thread'] = threading.Thread(target=live_update_poller, daemon=True)
+            live_poller['thread'].start()
 
 # Routes
 @app.route('/')
@@ -139,14 +968,15 @@ def dashboard():
     return render_template('dashboard.html')
 
 @app.route('/api/data/latest')
+@conditional_get
 def get_latest_data():
     try:
         latest = TeslaData.query.order_by(desc(TeslaData.timestamp)).first()
         if latest:
-            data_dict = latest.to_dict()
+            data_dict = latest.last_sample().to_dict()
             # Add debugging info
             data_dict['debug'] = {
-                'record_count': TeslaData.query.count(),
+                'record_count': get_stats().record_count,
                 'timestamp': datetime.now().isoformat(),
                 'teslafi_token_set': bool(os.environ.get('TESLAFI_API_TOKEN'))
             }
@@ -174,237 +1004,240 @@ def get_latest_data():
             }
         }), 500
 
+@app.route('/api/stream')
+def stream_latest_data():
+    """Server-Sent Events: the latest sample on connect, then a delta whenever a newer sample is stored"""
+    if live_updates.subscriber_count() >= STREAM_MAX_CLIENTS:
+        return jsonify({
+            "success": False,
+            "error": "Too many live connections, poll /api/data/latest instead",
+            "timestamp": datetime.now().isoformat()
+        }), 503
+
+    ensure_live_poller()
+    # Subscribe before reading the snapshot so no sample falls in between; deltas are absolute values
+    subscriber = live_updates.subscribe()
+    try:
+        snapshot = latest_snapshot()
+    except Exception:
+        live_updates.unsubscribe(subscriber)
+        raise
+
+    def events():
+        try:
+            yield 'retry: 5000\n\n'
+            if snapshot is not None:
+                yield format_event('snapshot', app.json.dumps(snapshot))
+            deadline = time.monotonic() + STREAM_MAX_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    message = subscriber.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if message is None:
+                    break
+                yield format_event(*message)
+        finally:
+            live_updates.unsubscribe(subscriber)
+
+    return app.response_class(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/sessions')
+@conditional_get
+def get_sessions():
+    """Most recent sessions, newest first: /api/sessions?kind=charge&limit=50"""
+    kind = request.args.get('kind')
+    limit = min(request.args.get('limit', 50, type=int), 1000)
+    kinds = [k for k, _ in SESSION_KINDS]
+    if kind is not None and kind not in kinds:
+        return jsonify({
+            "success": False,
+            "error": f"Unknown session kind: {kind}",
+            "available": kinds,
+            "timestamp": datetime.now().isoformat()
+        }), 400
+
+    query = TeslaSession.query
+    if kind is not None:
+        query = query.filter(TeslaSession.kind == kind)
+    sessions = query.order_by(desc(TeslaSession.start_time)).limit(limit).all()
+    return jsonify({'success': True, 'data': [session.to_dict() for session in sessions]})
+
+@app.route('/api/stats')
+@conditional_get
+def get_data_stats():
+    """Row count, time span and latest data_id of the stored data"""
+    try:
+        return jsonify(dict(get_stats().to_dict(), timestamp=datetime.now().isoformat()))
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+# Rows fetched per round trip (and per response chunk) when streaming history
+HISTORY_STREAM_BATCH = 1000
+
+def sample_dicts(row, since):
+    """One metric dictionary per sample a stored row stands for, from since on; runs are expanded with run_samples"""
+    values = tesla_data_dict(dict(row._mapping))
+    if len(run_samples(row)) == 1:
+        return [values] if row.timestamp >= since else []
+    return [
+        dict(values, data_id=sample.data_id, timestamp=sample.timestamp, valid_until=None, last_data_id=None, sample_count=1)
+        for sample in run_samples(row) if sample.timestamp >= since
+    ]
+
+def history_rows(since):
+    """Samples since the given time as metric dictionaries, fetched in batches from a server-side cursor"""
+    columns = TeslaData.__table__.columns
+    connection = db.session.connection()
+    # Runs never overlap, so only the row just before the range can still have samples inside it
+    before = connection.execute(
+        select(*columns).where(TeslaData.timestamp < since).order_by(desc(TeslaData.timestamp)).limit(1)
+    ).first()
+    if before is not None and before.valid_until is not None and before.valid_until >= since:
+        yield sample_dicts(before, since)
+    stmt = select(*columns).where(TeslaData.timestamp >= since).order_by(TeslaData.timestamp)
+    result = connection.execute(stmt.execution_options(yield_per=HISTORY_STREAM_BATCH))
+    for partition in result.partitions():
+        yield [values for row in partition for values in sample_dicts(row, since)]
+
+def history_ndjson(batches):
+    for batch in batches:
+        yield ''.join(app.json.dumps(row) + '\n' for row in batch)
+
+def history_csv(batches):
+    buffer = io.StringIO()
+    writer = None
+    for batch in batches:
+        if not batch:
+            continue
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(batch[0]))
+            writer.writeheader()
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+def gzip_chunks(chunks):
+    """Compress a stream of text chunks into a single gzip member"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+HISTORY_FORMATS = {
+    'ndjson': (history_ndjson, 'application/x-ndjson'),
+    'csv': (history_csv, 'text/csv'),
+}
+
 @app.route('/api/data/history')
 def get_history_data():
     days = request.args.get('days', 7, type=int)
     since = datetime.utcnow() - timedelta(days=days)
-    data = TeslaData.query.filter(TeslaData.timestamp >= since).order_by(TeslaData.timestamp).all()
-    return jsonify([item.to_dict() for item in data])
+    output_format = request.args.get('format', 'json')
 
-@app.route('/api/charts/battery')
-def battery_chart():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    start_time = request.args.get('start_time', '00:00:00')
-    end_time = request.args.get('end_time', '23:59:59')
-    
-    # Default to last hour if no dates provided
-    if not start_date or not end_date:
-        since = datetime.now(timezone.utc) - timedelta(hours=1)
-        data = TeslaData.query.filter(TeslaData.timestamp >= since).order_by(TeslaData.timestamp).all()
-    else:
-        # Parse date strings and combine with time for precise filtering
-        start_dt = datetime.strptime(f"{start_date} {start_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        end_dt = datetime.strptime(f"{end_date} {end_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        data = TeslaData.query.filter(
-            TeslaData.timestamp >= start_dt,
-            TeslaData.timestamp <= end_dt
-        ).order_by(TeslaData.timestamp).all()
-    
-    if not data:
-        return jsonify({'success': True, 'data': {'labels': [], 'values': []}})
-    
-    # Convert UTC timestamps to Europe/Sofia timezone
-    sofia_tz = pytz.timezone('Europe/Sofia')
-    labels = [d.timestamp.replace(tzinfo=timezone.utc).astimezone(sofia_tz).strftime('%Y-%m-%d %H:%M') for d in data]
-    values = [d.battery_level for d in data]
-    
-    return jsonify({'success': True, 'data': {'labels': labels, 'values': values}})
+    if output_format == 'json':
+        return jsonify([values for batch in history_rows(since) for values in batch])
 
-@app.route('/api/charts/temperature')
-def temperature_chart():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    start_time = request.args.get('start_time', '00:00:00')
-    end_time = request.args.get('end_time', '23:59:59')
-    
-    # Default to last hour if no dates provided
-    if not start_date or not end_date:
-        since = datetime.now(timezone.utc) - timedelta(hours=1)
-        data = TeslaData.query.filter(TeslaData.timestamp >= since).order_by(TeslaData.timestamp).all()
-    else:
-        # Parse date strings and combine with time for precise filtering
-        start_dt = datetime.strptime(f"{start_date} {start_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        end_dt = datetime.strptime(f"{end_date} {end_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        data = TeslaData.query.filter(
-            TeslaData.timestamp >= start_dt,
-            TeslaData.timestamp <= end_dt
-        ).order_by(TeslaData.timestamp).all()
-    
-    if not data:
-        return jsonify({'success': True, 'data': {'labels': [], 'outside': [], 'inside': []}})
-    
-    # Convert UTC timestamps to Europe/Sofia timezone
-    sofia_tz = pytz.timezone('Europe/Sofia')
-    labels = [d.timestamp.replace(tzinfo=timezone.utc).astimezone(sofia_tz).strftime('%Y-%m-%d %H:%M') for d in data]
-    outside = [d.outside_temp for d in data]
-    inside = [d.inside_temp for d in data]
-    
-    return jsonify({'success': True, 'data': {'labels': labels, 'outside': outside, 'inside': inside}})
+    if output_format not in HISTORY_FORMATS:
+        return jsonify({
+            "success": False,
+            "error": f"Unknown format: {output_format}",
+            "available": ['json'] + list(HISTORY_FORMATS),
+            "timestamp": datetime.now().isoformat()
+        }), 400
 
-@app.route('/api/charts/charging')
-def charging_chart():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    start_time = request.args.get('start_time', '00:00:00')
-    end_time = request.args.get('end_time', '23:59:59')
-    
-    # Default to last hour if no dates provided
-    if not start_date or not end_date:
-        since = datetime.now(timezone.utc) - timedelta(hours=1)
-        data = TeslaData.query.filter(TeslaData.timestamp >= since).order_by(TeslaData.timestamp).all()
-    else:
-        # Parse date strings and combine with time for precise filtering
-        start_dt = datetime.strptime(f"{start_date} {start_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        end_dt = datetime.strptime(f"{end_date} {end_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        data = TeslaData.query.filter(
-            TeslaData.timestamp >= start_dt,
-            TeslaData.timestamp <= end_dt
-        ).order_by(TeslaData.timestamp).all()
-    
-    if not data:
-        return jsonify({'success': True, 'data': {'labels': [], 'charging_state': [], 'charge_rate': [], 'charger_power': []}})
-    
-    # Convert UTC timestamps to Europe/Sofia timezone
-    sofia_tz = pytz.timezone('Europe/Sofia')
-    labels = [d.timestamp.replace(tzinfo=timezone.utc).astimezone(sofia_tz).strftime('%Y-%m-%d %H:%M') for d in data]
-    
-    # Charging state (0/1), charge rate (kW), and charger power (kW)
-    charging_state = []
-    charge_rate = []
-    charger_power = []
-    
-    for d in data:
-        # Convert charging state to 0/1 - more robust logic
-        charging_state_value = 0
-        if d.charging_state:
-            charging_state_lower = d.charging_state.lower()
-            # Check for various charging states
-            if any(state in charging_state_lower for state in ['charging', 'connected', 'complete']):
-                charging_state_value = 1
-            # Explicitly check for disconnected states
-            elif any(state in charging_state_lower for state in ['disconnected', 'stopped']):
-                charging_state_value = 0
-            else:
-                # If it's not a known charging state, default to 0
-                charging_state_value = 0
-        else:
-            charging_state_value = 0
-        
-        charging_state.append(charging_state_value)
-        
-        # Use charge_rate (actual charging power in kW)
-        charge_rate.append(d.charge_rate if d.charge_rate is not None else 0)
-        
-        # Use charger_power (maximum power capability in kW)
-        charger_power.append(d.charger_power if d.charger_power is not None else 0)
-    
-    return jsonify({
-        'success': True, 
-        'data': {
-            'labels': labels, 
-            'charging_state': charging_state, 
-            'charge_rate': charge_rate,
-            'charger_power': charger_power
-        }
-    })
+    # Streamed formats never hold more than one batch of rows in memory
+    render, mimetype = HISTORY_FORMATS[output_format]
+    chunks = render(history_rows(since))
+    headers = {'Content-Disposition': f'attachment; filename=tesla_history_{days}d.{output_format}'}
+    if 'gzip' in request.accept_encodings:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+        headers['Vary'] = 'Accept-Encoding'
+    return app.response_class(stream_with_context(chunks), mimetype=mimetype, headers=headers)
 
-@app.route('/api/charts/tire_pressure')
-def tire_pressure_chart():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    start_time = request.args.get('start_time', '00:00:00')
-    end_time = request.args.get('end_time', '23:59:59')
-    
-    # Default to last hour if no dates provided
-    if not start_date or not end_date:
-        since = datetime.now(timezone.utc) - timedelta(hours=1)
-        data = TeslaData.query.filter(TeslaData.timestamp >= since).order_by(TeslaData.timestamp).all()
-    else:
-        # Parse date strings and combine with time for precise filtering
-        start_dt = datetime.strptime(f"{start_date} {start_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        end_dt = datetime.strptime(f"{end_date} {end_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        data = TeslaData.query.filter(
-            TeslaData.timestamp >= start_dt,
-            TeslaData.timestamp <= end_dt
-        ).order_by(TeslaData.timestamp).all()
-    
-    if not data:
-        return jsonify({'success': True, 'data': {'labels': [], 'values': []}})
-    
-    # Convert UTC timestamps to Europe/Sofia timezone
-    sofia_tz = pytz.timezone('Europe/Sofia')
-    labels = [d.timestamp.replace(tzinfo=timezone.utc).astimezone(sofia_tz).strftime('%Y-%m-%d %H:%M') for d in data]
-    
-    # Convert tire pressures from psi to bar
-    front_left = [psi_to_bar(d.tpms_front_left) for d in data]
-    front_right = [psi_to_bar(d.tpms_front_right) for d in data]
-    rear_left = [psi_to_bar(d.tpms_rear_left) for d in data]
-    rear_right = [psi_to_bar(d.tpms_rear_right) for d in data]
-    
-    return jsonify({
-        'success': True, 
-        'data': {
-            'labels': labels,
-            'front_left': front_left,
-            'front_right': front_right,
-            'rear_left': rear_left,
-            'rear_right': rear_right
-        }
-    })
+def wants_chart_binary():
+    """Binary chart blocks requested with ?format=bin or an Accept header preferring them over JSON"""
+    if request.args.get('format') == 'bin':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', CHART_BINARY_MIMETYPE]) == CHART_BINARY_MIMETYPE
+
+def chart_binary_response(metrics, ms, columns, cursor=None):
+    """One binary chart block per metric, concatenated"""
+    body = b''.join(pack_chart_block(metric, *chart_series(metric, ms, columns), cursor=cursor) for metric in metrics)
+    return app.response_class(body, mimetype=CHART_BINARY_MIMETYPE)
+
+@app.route('/api/charts')
+@conditional_get
+def multi_chart():
+    """Several chart metrics from a single range query: /api/charts?metrics=battery,temperature"""
+    metrics = [m.strip() for m in request.args.get('metrics', '').split(',') if m.strip()]
+    unknown = [m for m in metrics if m not in CHART_METRICS]
+    if not metrics or unknown:
+        return jsonify({
+            'success': False,
+            'error': f"Unknown metrics: {', '.join(unknown)}" if unknown else 'No metrics requested',
+            'available': list(CHART_METRICS)
+        }), 400
+
+    ms, columns, cursor = load_chart_columns(*chart_columns(metrics))
+    if wants_chart_binary():
+        return chart_binary_response(metrics, ms, columns, cursor)
+    return jsonify({'success': True, 'data': {metric: build_chart_data(metric, ms, columns, cursor) for metric in metrics}})
+
+def make_chart_view(metric):
+    def chart_view():
+        ms, columns, cursor = load_chart_columns(*chart_columns([metric]))
+        if wants_chart_binary():
+            return chart_binary_response([metric], ms, columns, cursor)
+        return jsonify({'success': True, 'data': build_chart_data(metric, ms, columns, cursor)})
+    return chart_view
+
+for chart_metric in CHART_METRICS:
+    app.add_url_rule(f'/api/charts/{chart_metric}', endpoint=f'{chart_metric}_chart', view_func=conditional_get(make_chart_view(chart_metric)))
+
+def usage_kind():
+    """SQL CASE classifying a row as drive/charge/idle/sleep, NULL for rows without a TeslaFi date"""
+    return case(
+        (or_(TeslaData.date.is_(None), TeslaData.date == ''), None),
+        (TeslaData.charging_state_code == ChargingState.CHARGING, 'charge'),
+        (TeslaData.shift_state_code.in_([ShiftState.DRIVE, ShiftState.REVERSE]), 'drive'),
+        (TeslaData.state_code == VehicleState.ASLEEP, 'sleep'),
+        else_='idle'
+    )
 
 @app.route('/api/charts/usage_stats')
+@conditional_get
 def usage_stats_chart():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    start_time = request.args.get('start_time', '00:00:00')
-    end_time = request.args.get('end_time', '23:59:59')
-    
-    # Default to last hour if no dates provided
-    if not start_date or not end_date:
-        since = datetime.now(timezone.utc) - timedelta(hours=1)
-        data = TeslaData.query.filter(TeslaData.timestamp >= since).order_by(TeslaData.timestamp).all()
-    else:
-        # Parse date strings and combine with time for precise filtering
-        start_dt = datetime.strptime(f"{start_date} {start_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        end_dt = datetime.strptime(f"{end_date} {end_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        data = TeslaData.query.filter(
+    start_dt, end_dt = chart_range()
+
+    # Classified and counted in the database, no rows reach Python
+    kind = usage_kind().label('kind')
+    counts = dict(db.session.execute(
+        select(kind, func.sum(func.coalesce(TeslaData.sample_count, 1))).where(
             TeslaData.timestamp >= start_dt,
             TeslaData.timestamp <= end_dt
-        ).order_by(TeslaData.timestamp).all()
+        ).group_by(kind)
+    ).all())
     
-    if not data:
+    if not counts:
         return jsonify({'success': True, 'data': {'labels': [], 'datasets': []}})
     
-    # Analyze the data to detect sessions
-    drive_sessions = 0
-    charge_sessions = 0
-    idle_sessions = 0
-    sleep_sessions = 0
-    
-    # Group data by day to count sessions
-    from collections import defaultdict
-    daily_sessions = defaultdict(lambda: {'drive': 0, 'charge': 0, 'idle': 0, 'sleep': 0})
-    
-    for record in data:
-        date_key = record.date
-        if record.date:
-            # Count based on state and charging status
-            if record.charging_state and 'charging' in record.charging_state.lower():
-                daily_sessions[date_key]['charge'] += 1
-            elif record.shift_state and record.shift_state in ['D', 'R']:
-                daily_sessions[date_key]['drive'] += 1
-            elif record.state and 'sleep' in record.state.lower():
-                daily_sessions[date_key]['sleep'] += 1
-            else:
-                daily_sessions[date_key]['idle'] += 1
-    
-    # Sum up all sessions
-    for day_sessions in daily_sessions.values():
-        drive_sessions += day_sessions['drive']
-        charge_sessions += day_sessions['charge']
-        idle_sessions += day_sessions['idle']
-        sleep_sessions += day_sessions['sleep']
+    drive_sessions = counts.get('drive', 0)
+    charge_sessions = counts.get('charge', 0)
+    idle_sessions = counts.get('idle', 0)
+    sleep_sessions = counts.get('sleep', 0)
     
     # Calculate percentages
     total = drive_sessions + charge_sessions + idle_sessions + sleep_sessions
@@ -443,7 +1276,7 @@ def test_system():
         db.session.execute(text('SELECT 1'))
         
         # Count existing records
-        record_count = TeslaData.query.count()
+        record_count = get_stats().record_count
         
         # Try to fetch latest data
         latest = TeslaData.query.order_by(desc(TeslaData.timestamp)).first()
@@ -481,62 +1314,18 @@ def ingest_data():
             print(f"[{datetime.now()}] Received data_id: {data.get('data_id')}")
             
             # Check if data_id already exists to avoid duplicates
-            existing = TeslaData.query.filter_by(data_id=data.get('data_id')).first()
-            if existing:
+            if sample_stored(data.get('data_id')):
                 print(f"[{datetime.now()}] Data already exists (duplicate)")
                 return jsonify({"status": "duplicate", "message": "Data already exists"})
             
-            print(f"[{datetime.now()}] Creating new TeslaData record")
-            # Create new record
-            tesla_record = TeslaData(
-                data_id=data.get('data_id'),
-                date=data.get('Date'),
-                state=data.get('state'),
-                battery_level=safe_float(data.get('battery_level')),
-                battery_range=safe_float(data.get('battery_range')),
-                ideal_battery_range=safe_float(data.get('ideal_battery_range')),
-                est_battery_range=safe_float(data.get('est_battery_range')),
-                usable_battery_level=safe_float(data.get('usable_battery_level')),
-                charge_limit_soc=safe_float(data.get('charge_limit_soc')),
-                charging_state=data.get('charging_state'),
-                charge_rate=safe_float(data.get('charge_rate')),
-                charger_power=safe_float(data.get('charger_power')),
-                charger_voltage=safe_float(data.get('charger_voltage')),
-                charger_actual_current=safe_float(data.get('charger_actual_current')),
-                time_to_full_charge=safe_float(data.get('time_to_full_charge')),
-                charge_energy_added=safe_float(data.get('charge_energy_added')),
-                charge_miles_added_rated=safe_float(data.get('charge_miles_added_rated')),
-                inside_temp=safe_float(data.get('inside_temp')),
-                outside_temp=safe_float(data.get('outside_temp')),
-                driver_temp_setting=safe_float(data.get('driver_temp_setting')),
-                passenger_temp_setting=safe_float(data.get('passenger_temp_setting')),
-                is_climate_on=safe_bool(data.get('is_climate_on')),
-                is_preconditioning=safe_bool(data.get('is_preconditioning')),
-                latitude=safe_float(data.get('latitude')),
-                longitude=safe_float(data.get('longitude')),
-                speed=safe_float(data.get('speed')),
-                heading=safe_float(data.get('heading')),
-                odometer=safe_float(data.get('odometer')),
-                shift_state=data.get('shift_state'),
-                locked=safe_bool(data.get('locked')),
-                sentry_mode=safe_bool(data.get('sentry_mode')),
-                valet_mode=safe_bool(data.get('valet_mode')),
-                car_version=data.get('car_version'),
-                tpms_front_left=safe_float(data.get('tpms_front_left')),
-                tpms_front_right=safe_float(data.get('tpms_front_right')),
-                tpms_rear_left=safe_float(data.get('tpms_rear_left')),
-                tpms_rear_right=safe_float(data.get('tpms_rear_right')),
-                location=data.get('location'),
-                car_state=data.get('carState'),
-                max_range=safe_float(data.get('maxRange')),
-                sleep_number=safe_int(data.get('sleepNumber')),
-                drive_number=safe_int(data.get('driveNumber')),
-                charge_number=safe_int(data.get('chargeNumber')),
-                idle_number=safe_int(data.get('idleNumber'))
-            )
-            
-            db.session.add(tesla_record)
-            db.session.commit()
+            print(f"[{datetime.now()}] Spooling new TeslaData record")
+            position = spool_payloads([data])
+            if not ingest_spool.wait(position, SPOOL_COMMIT_WAIT):
+                print(f"[{datetime.now()}] Data spooled, not committed yet")
+                return jsonify({"status": "queued", "message": "Data spooled, not committed yet", "data_id": data.get('data_id')})
+            if not sample_stored(data.get('data_id')):
+                print(f"[{datetime.now()}] Data could not be stored (data_id: {data.get('data_id')})")
+                return jsonify({"success": False, "error": "Data could not be stored, see the spool's dead-letter file"}), 500
             print(f"[{datetime.now()}] Data stored successfully")
             
             return jsonify({"status": "success", "message": "Data stored successfully", "data_id": data.get('data_id')})
@@ -551,6 +1340,574 @@ def ingest_data():
         db.session.rollback()
         return jsonify({"success": False, "error": str(e)}), 500
 
+# Payloads per INSERT statement (and per commit) in batch ingestion
+INGEST_BATCH_CHUNK = 500
+
+def ndjson_payloads(stream):
+    """Parse an NDJSON request body line by line, None for lines that are not valid JSON"""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+def batch_record_values(payload):
+    """Column values of one batch payload, or None if it is not a TeslaFi record with a data_id"""
+    if not isinstance(payload, dict):
+        return None
+    values = tesla_record_values(payload)
+    if values['data_id'] is None:
+        return None
+    # Batches are mostly history, so the sample time comes from TeslaFi's Date rather than arrival
+    values['timestamp'] = teslafi_timestamp(values['date']) or datetime.utcnow()
+    return values
+
+def insert_new_records(rows):
+    """Insert TeslaData rows in one multi-row statement, skipping data_ids already stored; returns the new ids"""
+    table = TeslaData.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        stmt = insert(table).on_conflict_do_nothing(index_elements=['data_id']).returning(table.c.id)
+        return list(db.session.execute(stmt, rows).scalars())
+
+    # No ON CONFLICT: drop known and repeated data_ids up front
+    known = set(db.session.execute(
+        select(TeslaData.data_id).where(TeslaData.data_id.in_([row['data_id'] for row in rows]))
+    ).scalars())
+    fresh = []
+    for row in rows:
+        if row['data_id'] not in known:
+            known.add(row['data_id'])
+            fresh.append(row)
+    if not fresh:
+        return []
+    db.session.execute(table.insert(), fresh)
+    return list(db.session.execute(
+        select(TeslaData.id).where(TeslaData.data_id.in_([row['data_id'] for row in fresh]))
+    ).scalars())
+
+def stored_data_ids(data_ids):
+    """Those of the given data_ids already stored, as a row of their own or inside any run's data_id..last_data_id"""
+    ids = sorted({data_id for data_id in data_ids if data_id is not None})
+    if not ids:
+        return set()
+    stored = set(db.session.execute(select(TeslaData.data_id).where(TeslaData.data_id.in_(ids))).scalars())
+    # Runs that can cover these ids: the ones starting inside their span, and the row just below it
+    runs = db.session.execute(
+        select(TeslaData.data_id, TeslaData.last_data_id)
+        .where(TeslaData.data_id.between(ids[0], ids[-1]), TeslaData.last_data_id.isnot(None))
+    ).all()
+    below = db.session.execute(
+        select(TeslaData.data_id, TeslaData.last_data_id).where(TeslaData.data_id < ids[0])
+        .order_by(desc(TeslaData.data_id)).limit(1)
+    ).first()
+    if below is not None and below.last_data_id is not None:
+        runs.append(below)
+    for first, last in runs:
+        stored.update(ids[bisect.bisect_left(ids, first):bisect.bisect_right(ids, last)])
+    return stored
+
+def sample_stored(data_id):
+    """Whether a sample is stored, as its own row or folded into a run"""
+    data_id = safe_int(data_id)
+    return data_id is not None and data_id in stored_data_ids([data_id])
+
+def compact_rows(rows):
+    """Fold rows that repeat the run before them (same sample_hash, within the run's gap_threshold) into that run
+
+    Returns the rows still to insert, with their run columns set, and (run data_id, data_id, timestamp) of
+    each folded sample. The newest stored row is extended in the session (caller commits).
+    """
+    latest = TeslaData.query.order_by(desc(TeslaData.timestamp)).first()
+    run = None
+    if latest is not None and latest.content_hash is not None:
+        run = {
+            'target': latest, 'content_hash': latest.content_hash, 'data_id': latest.data_id,
+            'last_data_id': latest.last_data_id or latest.data_id,
+            'valid_until': latest.valid_until or latest.timestamp, 'sample_count': latest.sample_count or 1,
+            'window': gap_threshold(sample_poll_mode(latest)),
+        }
+    runs = [run] if run is not None else []
+    fresh, folded = [], []
+    for values in sorted(rows, key=lambda values: values['timestamp']):
+        values['content_hash'] = sample_hash(values)
+        if run is not None and run['data_id'] <= values['data_id'] <= run['last_data_id']:
+            # Already part of the run (a replayed spool entry)
+            continue
+        if (run is not None and values['content_hash'] == run['content_hash'] and values['data_id'] > run['last_data_id']
+                and timedelta(0) <= values['timestamp'] - run['valid_until'] <= run['window']):
+            run['last_data_id'] = values['data_id']
+            run['valid_until'] = values['timestamp']
+            run['sample_count'] += 1
+            folded.append((run['data_id'], values['data_id'], values['timestamp']))
+            continue
+        values.update(valid_until=None, last_data_id=None, sample_count=1)
+        fresh.append(values)
+        run = {
+            'target': values, 'content_hash': values['content_hash'], 'data_id': values['data_id'],
+            'last_data_id': values['data_id'], 'valid_until': values['timestamp'], 'sample_count': 1,
+            # Runs continue at the cadence that polled them: half an hour apart while asleep
+            'window': gap_threshold(sample_poll_mode(values)),
+        }
+        runs.append(run)
+
+    for run in runs:
+        if run['sample_count'] == 1:
+            continue
+        changes = {column: run[column] for column in ('valid_until', 'last_data_id', 'sample_count')}
+        if isinstance(run['target'], dict):
+            run['target'].update(changes)
+        elif run['sample_count'] != (latest.sample_count or 1):
+            for column, value in changes.items():
+                setattr(latest, column, value)
+    return fresh, folded
+
+def store_ingest_chunk(rows, detect_gaps=False, compact=False):
+    """Insert one chunk of payload values, update the derived tables and commit; returns the number of samples stored
+
+    With compact, samples that repeat the previous one are folded into its run instead of getting their own row.
+    """
+    mark = high_water_mark() if detect_gaps else None
+    # Samples folded into a run have no row of their own, so ON CONFLICT would not catch them
+    stored = stored_data_ids(values['data_id'] for values in rows)
+    rows = [values for values in rows if values['data_id'] not in stored]
+    folded = []
+    if compact:
+        rows, folded = compact_rows(rows)
+    ids = insert_new_records(rows) if rows else []
+    records = TeslaData.query.filter(TeslaData.id.in_(ids)).all() if ids else []
+    if folded:
+        # Folded samples count for rollups, stats, sessions and gaps like any other
+        runs = {record.data_id: record for record in records}
+        for run_data_id, data_id, timestamp in folded:
+            if run_data_id not in runs:
+                runs[run_data_id] = TeslaData.query.filter_by(data_id=run_data_id).first()
+            if runs[run_data_id] is not None:
+                records.append(RunSample(runs[run_data_id], data_id, timestamp))
+    newest = None
+    snapshots = []
+    if records:
+        update_derived_tables(records)
+        # Sort before the commit expires the records, reading timestamps afterwards reloads each row
+        records.sort(key=lambda record: record.timestamp)
+        newest = records[-1]
+        if detect_gaps:
+            for record in records:
+                record_gap(mark, record)
+                if mark[1] is None or record.timestamp > mark[1]:
+                    mark = (record.data_id, record.timestamp, sample_poll_mode(record))
+        if INFLUXDB_DUAL_WRITE:
+            snapshots = [record.to_dict() for record in records]
+    db.session.commit()
+    if newest is not None:
+        mark_data_changed(newest)
+    if snapshots:
+        publish_to_influx(snapshots)
+    return len(records)
+
+# Optional dual-write of every committed sample to InfluxDB (tesla_influxdb), on when INFLUXDB_URL is set
+INFLUXDB_DUAL_WRITE = bool(os.environ.get('INFLUXDB_URL'))
+influx = {'db': None}
+influx_lock = threading.Lock()
+
+def influx_sink():
+    """The process's TeslaInfluxDB with its batching writer, created on first use; None when dual-write is off"""
+    if not INFLUXDB_DUAL_WRITE:
+        return None
+    with influx_lock:
+        if influx['db'] is None:
+            try:
+                from tesla_influxdb import TeslaInfluxDB
+                influx['db'] = TeslaInfluxDB()
+                # Queued points are written out on a clean shutdown
+                atexit.register(influx['db'].close)
+            except Exception as e:
+                print(f"[{datetime.now()}] InfluxDB dual-write disabled: {e}")
+                influx['db'] = False
+    return influx['db'] or None
+
+def publish_to_influx(snapshots):
+    """Queue committed samples for InfluxDB without waiting; what does not fit in its buffer is dropped and counted"""
+    sink = influx_sink()
+    if sink is None:
+        return
+    dropped = sum(not sink.enqueue_tesla_data(snapshot) for snapshot in snapshots)
+    if dropped:
+        print(f"[{datetime.now()}] InfluxDB buffer full, {dropped} samples not dual-written")
+
+@app.route('/api/ingest/batch', methods=['POST'])
+def ingest_batch():
+    """Bulk ingestion of TeslaFi payloads as a JSON array or NDJSON (application/x-ndjson), duplicates skipped"""
+    if request.mimetype == 'application/x-ndjson':
+        payloads = ndjson_payloads(request.stream)
+    else:
+        payloads = request.get_json(silent=True)
+        if not isinstance(payloads, list):
+            return jsonify({
+                "success": False,
+                "error": "Expected a JSON array of TeslaFi records or an application/x-ndjson body",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+
+    counts = {"received": 0, "inserted": 0, "duplicate": 0, "invalid": 0}
+    try:
+        # The spool writer stores the records; this request only checks, spools and waits
+        spooled = []
+        position = spool_dated_payloads(payloads, counts, spooled)
+    except Exception as e:
+        print(f"[{datetime.now()}] Error in ingest_batch: {e}")
+        db.session.rollback()
+        # Chunks spooled before the error are still stored and are counted
+        return jsonify({"success": False, "error": str(e), **counts}), 500
+
+    if position is not None and not ingest_spool.wait(position, SPOOL_COMMIT_WAIT):
+        print(f"[{datetime.now()}] Batch ingest spooled, not committed yet: {counts}")
+        return jsonify({"status": "queued", **counts})
+    settle_dated_counts(counts, spooled)
+    print(f"[{datetime.now()}] Batch ingest: {counts}")
+    return jsonify({"status": "success", **counts})
+
+# A stretch without new samples, ending in a newly fetched one, is recorded as a gap when it is longer than the
+# poll interval chosen after the sample before it plus GAP_MARGIN_MINUTES; GAP_THRESHOLD_MINUTES fixes it instead
+GAP_MARGIN_MINUTES = int(os.environ.get('GAP_MARGIN_MINUTES', '15'))
+GAP_THRESHOLD_MINUTES = int(os.environ['GAP_THRESHOLD_MINUTES']) if os.environ.get('GAP_THRESHOLD_MINUTES') else None
+# Paged TeslaFi history feed for filling gaps, with {token}, {start}, {end} (TeslaFi local time) and {page};
+# without it gaps are only recorded
+TESLAFI_HISTORY_URL = os.environ.get('TESLAFI_HISTORY_URL')
+GAP_FILL_MAX_PAGES = int(os.environ.get('GAP_FILL_MAX_PAGES', '50'))
+# Open gaps tried per successful fetch, oldest first
+GAP_FILL_PER_RUN = 3
+
+GAP_STATUSES = ['open', 'filled']
+
+class TeslaGap(db.Model):
+    """A stretch of the series with no stored samples, between the high-water mark and a newly fetched sample"""
+    __tablename__ = 'tesla_gaps'
+    id = db.Column(db.Integer, primary_key=True)
+    start_time = db.Column(db.DateTime, nullable=False, index=True)
+    end_time = db.Column(db.DateTime, nullable=False)
+    start_data_id = db.Column(db.Integer)
+    end_data_id = db.Column(db.Integer)
+    status = db.Column(db.String(10), nullable=False, default='open', index=True)
+    records_filled = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(200))
+    detected_at = db.Column(db.DateTime, default=datetime.utcnow)
+    filled_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'start_time': self.start_time.isoformat(),
+            'end_time': self.end_time.isoformat(),
+            'duration_minutes': (self.end_time - self.start_time).total_seconds() / 60,
+            'start_data_id': self.start_data_id,
+            'end_data_id': self.end_data_id,
+            'status': self.status,
+            'records_filled': self.records_filled,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'detected_at': self.detected_at.isoformat() if self.detected_at else None,
+            'filled_at': self.filled_at.isoformat() if self.filled_at else None,
+        }
+
+def sample_poll_mode(sample):
+    """Poll mode the scheduler picks after a sample: a stored record or a dict of column values"""
+    if isinstance(sample, dict):
+        codes = {column: state_code(names, sample.get(source)) for column, (source, names) in STATE_CODE_COLUMNS.items()}
+    else:
+        codes = {column: getattr(sample, column) for column in STATE_CODE_COLUMNS}
+    return poll_policy.mode(codes)
+
+def gap_threshold(mode):
+    """Longest stretch without samples that is not a gap, after a sample in this poll mode"""
+    if GAP_THRESHOLD_MINUTES is not None:
+        return timedelta(minutes=GAP_THRESHOLD_MINUTES)
+    return timedelta(seconds=poll_policy.intervals[mode], minutes=GAP_MARGIN_MINUTES)
+
+def high_water_mark():
+    """(latest data_id, newest sample time, its poll mode) stored so far, read before a new sample is added"""
+    stats = get_stats()
+    return stats.latest_data_id, stats.last_timestamp, poll_policy.mode(latest_poll_state())
+
+def record_gap(mark, record):
+    """Record a gap if the new record lands later after the mark than its poll mode's gap_threshold (caller commits)"""
+    last_data_id, last_timestamp, last_mode = mark
+    if last_timestamp is None or record.timestamp - last_timestamp <= gap_threshold(last_mode):
+        return None
+    gap = TeslaGap(
+        start_time=last_timestamp, end_time=record.timestamp,
+        start_data_id=last_data_id, end_data_id=record.data_id
+    )
+    db.session.add(gap)
+    print(f"[{datetime.now()}] Gap detected: no samples from {last_timestamp} to {record.timestamp} UTC")
+    return gap
+
+def teslafi_local_time(utc_dt):
+    """Naive UTC datetime as a TeslaFi Date string in TESLAFI_TIMEZONE"""
+    return pytz.utc.localize(utc_dt).astimezone(pytz.timezone(TESLAFI_TIMEZONE)).strftime('%Y-%m-%d %H:%M:%S')
+
+def fetch_history_page(token, start, end, page):
+    """One page of TeslaFi records between two UTC times, [] once the range is exhausted"""
+    url = TESLAFI_HISTORY_URL.format(
+        token=token, start=quote(teslafi_local_time(start)), end=quote(teslafi_local_time(end)), page=page
+    )
+    response = teslafi_client.get(url)
+    response.raise_for_status()
+    payload = response.json()
+    if isinstance(payload, dict):
+        payload = payload.get('data') or payload.get('results') or []
+    return payload if isinstance(payload, list) else []
+
+def fill_gap(gap, token):
+    """Page through the TeslaFi history for one gap and spool what it returns for the writer"""
+    gap.attempts += 1
+    # Committed first, so no write lock is held while the spool writer stores the records
+    db.session.commit()
+    start, end = gap.start_time, gap.end_time
+    counts = {"received": 0, "inserted": 0, "duplicate": 0, "invalid": 0}
+    spooled = []
+    position = None
+    try:
+        for page in range(1, GAP_FILL_MAX_PAGES + 1):
+            payloads = fetch_history_page(token, start, end, page)
+            if not payloads:
+                break
+            # Stored by the spool writer like every other sample
+            position = spool_dated_payloads(payloads, counts, spooled) or position
+        else:
+            raise RuntimeError(f"Stopped after {GAP_FILL_MAX_PAGES} pages")
+        if position is not None and not ingest_spool.wait(position, SPOOL_COMMIT_WAIT):
+            # The gap stays open; the next attempt re-fetches it and the spooled records are skipped as duplicates
+            raise RuntimeError("Records spooled, not committed yet")
+        settle_dated_counts(counts, spooled)
+    except Exception as e:
+        filled = counts["inserted"]
+        db.session.rollback()
+        # Request errors quote the URL, keep the token out of the stored and printed message
+        error = str(e).replace(token, '***')
+        gap = db.session.get(TeslaGap, gap.id)
+        gap.records_filled += filled
+        gap.last_error = error[:200]
+        db.session.commit()
+        print(f"[{datetime.now()}] Gap {gap.id} not filled: {error}")
+        return filled
+
+    filled = counts["inserted"]
+    gap.status = 'filled'
+    gap.records_filled += filled
+    gap.last_error = None
+    gap.filled_at = datetime.utcnow()
+    db.session.commit()
+    print(f"[{datetime.now()}] Gap {gap.id} filled with {filled} records")
+    return filled
+
+def fill_open_gaps(token):
+    """Try to fill the oldest open gaps from the TeslaFi history feed, if one is configured"""
+    if not TESLAFI_HISTORY_URL or not token:
+        return 0
+    gaps = TeslaGap.query.filter_by(status='open').order_by(TeslaGap.start_time).limit(GAP_FILL_PER_RUN).all()
+    return sum(fill_gap(gap, token) for gap in gaps)
+
+# Fetched and posted samples are appended here first; one writer thread per host commits them in batches,
+# so nothing fetched is lost to a crash and only one connection writes to the database
+SPOOL_DIR = os.environ.get('SPOOL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spool'))
+SPOOL_BATCH = int(os.environ.get('SPOOL_BATCH', '500'))
+SPOOL_POLL_SECONDS = float(os.environ.get('SPOOL_POLL_SECONDS', '1'))
+# How long a fetch or POST waits for its sample to be committed before answering "queued"
+SPOOL_COMMIT_WAIT = float(os.environ.get('SPOOL_COMMIT_WAIT', '10'))
+SPOOL_FSYNC = os.environ.get('SPOOL_FSYNC', 'true').lower() != 'false'
+# Fold unchanged samples (parked, asleep) into run-length rows instead of storing each one
+INGEST_COMPACT = os.environ.get('INGEST_COMPACT', 'true').lower() != 'false'
+
+ingest_spool = Spool(SPOOL_DIR, fsync=SPOOL_FSYNC)
+spool_writer = {'thread': None, 'lease': FileLease(os.path.join(SPOOL_DIR, 'writer.lock'))}
+spool_writer_lock = threading.Lock()
+spool_wakeup = threading.Event()
+
+def spool_payloads(payloads, dated=False):
+    """Durably append TeslaFi payloads with their arrival time and wake the writer; returns the position to wait for
+
+    Dated payloads (batch ingestion, gap fill) are timed by their own Date and stored one row each.
+    """
+    received_at = datetime.utcnow().isoformat()
+    extra = {"dated": True} if dated else {}
+    position = ingest_spool.append([dict(received_at=received_at, payload=payload, **extra) for payload in payloads])
+    ensure_spool_writer()
+    return position
+
+def spool_dated_payloads(payloads, counts, spooled):
+    """Spool TeslaFi history records in INGEST_BATCH_CHUNK appends, skipping invalid and already stored ones
+
+    Adds to the received/invalid/duplicate/inserted counts and the spooled data_ids; returns the position to wait for,
+    None if nothing was spooled.
+    """
+    position = None
+    seen = set()
+
+    def flush(chunk):
+        stored = stored_data_ids(values['data_id'] for _, values in chunk)
+        fresh = [payload for payload, values in chunk if values['data_id'] not in stored]
+        spooled.extend(values['data_id'] for _, values in chunk if values['data_id'] not in stored)
+        counts["duplicate"] += len(chunk) - len(fresh)
+        counts["inserted"] += len(fresh)
+        return spool_payloads(fresh, dated=True) if fresh else None
+
+    chunk = []
+    for payload in payloads:
+        counts["received"] += 1
+        values = batch_record_values(payload)
+        if values is None:
+            counts["invalid"] += 1
+            continue
+        if values['data_id'] in seen:
+            counts["duplicate"] += 1
+            continue
+        seen.add(values['data_id'])
+        chunk.append((payload, values))
+        if len(chunk) >= INGEST_BATCH_CHUNK:
+            position = flush(chunk) or position
+            chunk = []
+    if chunk:
+        position = flush(chunk) or position
+    return position
+
+def settle_dated_counts(counts, spooled):
+    """After the writer committed them, move spooled records that were dead-lettered from inserted to failed"""
+    stored = 0
+    for i in range(0, len(spooled), INGEST_BATCH_CHUNK):
+        stored += db.session.scalar(
+            select(func.count()).select_from(TeslaData).where(TeslaData.data_id.in_(spooled[i:i + INGEST_BATCH_CHUNK]))
+        )
+    counts["failed"] = len(spooled) - stored
+    counts["inserted"] -= counts["failed"]
+
+def spooled_record_values(entry):
+    """Column values of one spool entry, or None if it is not a TeslaFi record with a data_id"""
+    if not isinstance(entry, dict) or not isinstance(entry.get('payload'), dict):
+        return None
+    if entry.get('dated'):
+        return batch_record_values(entry['payload'])
+    values = tesla_record_values(entry['payload'])
+    if values['data_id'] is None:
+        return None
+    try:
+        values['timestamp'] = datetime.fromisoformat(entry['received_at'])
+    except (KeyError, TypeError, ValueError):
+        values['timestamp'] = datetime.utcnow()
+    return values
+
+def drain_spool():
+    """Commit the spooled entries in SPOOL_BATCH-sized transactions; returns the number of entries consumed"""
+    consumed = 0
+    while True:
+        entries, position = ingest_spool.read(SPOOL_BATCH)
+        if not entries:
+            if position != ingest_spool.committed():
+                ingest_spool.commit(position)
+            return consumed
+        rows = [(entry, values) for entry, values in zip(entries, map(spooled_record_values, entries)) if values is not None]
+        if len(rows) < len(entries):
+            print(f"[{datetime.now()}] Skipping {len(entries) - len(rows)} unreadable spool entries")
+        failures = []
+        if rows:
+            # Replaying entries after a crash between commit and offset update is harmless: duplicates are skipped
+            try:
+                store_spooled_rows(rows)
+            except OperationalError:
+                # Locked or unavailable database: keep the entries and retry the whole batch later
+                raise
+            except Exception as e:
+                db.session.rollback()
+                print(f"[{datetime.now()}] Spool batch failed ({e}), storing its entries one by one")
+                failures = store_spooled_rows_singly(rows)
+        if failures:
+            ingest_spool.dead_letter(failures)
+            print(f"[{datetime.now()}] Moved {len(failures)} spool entries that cannot be stored to the dead-letter file")
+        ingest_spool.commit(position)
+        consumed += len(entries)
+
+def store_spooled_rows(rows):
+    """Store (entry, values) pairs: fetched samples compacted and checked for gaps, dated history records one row each"""
+    for dated, group in itertools.groupby(rows, key=lambda row: bool(row[0].get('dated'))):
+        store_ingest_chunk([values for _, values in group], detect_gaps=not dated, compact=INGEST_COMPACT and not dated)
+
+def store_spooled_rows_singly(rows):
+    """Store (entry, values) pairs one transaction each; returns (entry, error) for the ones that still fail"""
+    failures = []
+    for row in rows:
+        try:
+            store_spooled_rows([row])
+        except OperationalError:
+            raise
+        except Exception as e:
+            db.session.rollback()
+            failures.append((row[0], e))
+    return failures
+
+def spool_writer_worker():
+    """Background thread that moves spooled samples into the database; only the lock holder on this host drains"""
+    lease = spool_writer['lease']
+    with app.app_context():
+        while True:
+            spool_wakeup.wait(SPOOL_POLL_SECONDS)
+            spool_wakeup.clear()
+            try:
+                if lease.acquire():
+                    drained = drain_spool()
+                    if drained:
+                        print(f"[{datetime.now()}] Spool writer committed {drained} entries")
+            except Exception as e:
+                # The entries stay in the spool and are retried on the next round
+                db.session.rollback()
+                print(f"[{datetime.now()}] ERROR in spool writer: {e}")
+                time.sleep(SPOOL_POLL_SECONDS)
+            finally:
+                db.session.remove()
+
+def ensure_spool_writer():
+    """Start this process's spool writer thread if needed and wake it"""
+    with spool_writer_lock:
+        if spool_writer['thread'] is None:
+            ingest_spool.ensure_directory()
+            spool_writer['thread'] = threading.Thread(target=spool_writer_worker, daemon=True)
+            spool_writer['thread'].start()
+    spool_wakeup.set()
+
+def spool_status():
+    """Spool backlog and which process drains it, for /api/ingest/status"""
+    return dict(ingest_spool.stats(), writer=spool_writer['lease'].holder(),
+                writer_running=spool_writer['thread'] is not None)
+
+@app.route('/api/ingest/gaps')
+def get_ingest_gaps():
+    """Known gaps in the stored series, newest first: /api/ingest/gaps?status=open&limit=50"""
+    status = request.args.get('status')
+    limit = min(request.args.get('limit', 50, type=int), 1000)
+    if status is not None and status not in GAP_STATUSES:
+        return jsonify({
+            "success": False,
+            "error": f"Unknown gap status: {status}",
+            "available": GAP_STATUSES,
+            "timestamp": datetime.now().isoformat()
+        }), 400
+
+    query = TeslaGap.query
+    if status is not None:
+        query = query.filter(TeslaGap.status == status)
+    gaps = query.order_by(desc(TeslaGap.start_time)).limit(limit).all()
+    return jsonify({
+        'success': True,
+        'data': [gap.to_dict() for gap in gaps],
+        'open': TeslaGap.query.filter_by(status='open').count(),
+        'catch_up_enabled': bool(TESLAFI_HISTORY_URL),
+        'threshold_minutes': {mode: gap_threshold(mode).total_seconds() / 60 for mode in poll_policy.intervals},
+    })
+
 @app.route('/api/ingest/manual', methods=['GET'])
 def manual_ingest():
     """Manual data ingestion endpoint (GET request for easy testing)"""
@@ -581,8 +1938,15 @@ def ingest_status():
             "status": "running" if scheduler_running else "stopped",
             "next_run": next_run_time.isoformat() if next_run_time else None,
             "last_run": last_run_time.isoformat() if last_run_time else None,
-            "interval": "5 minutes",
+            "interval": f"{poll_interval} seconds",
+            "poll_mode": poll_mode,
+            "poll_interval_seconds": poll_interval,
+            "poll_intervals": poll_policy.intervals,
             "thread_alive": scheduler_thread.is_alive() if scheduler_thread else False,
+            "teslafi_http": teslafi_client.stats(),
+            "leader": leader_status(),
+            "spool": spool_status(),
+            "influxdb": influx_sink().stats() if influx_sink() else None,
             "current_time": datetime.now().isoformat()
         }
         return jsonify(status_info)
@@ -596,6 +1960,14 @@ def ingest_status():
 def start_ingestion():
     """Start the automatic data ingestion scheduler"""
     try:
+        if not is_leader:
+            # Another process ingests; a second scheduler would poll TeslaFi twice
+            return jsonify(dict(
+                leader_status(),
+                success=False,
+                error="This process is not the ingestion leader",
+                timestamp=datetime.now().isoformat()
+            )), 409
         start_scheduler()
         return jsonify({
             "success": True,
@@ -626,12 +1998,60 @@ def stop_ingestion():
             "timestamp": datetime.now().isoformat()
         }), 500
 
+# Demo record in TeslaFi's own payload format, stored through the same field mapper as real data
+TEST_PAYLOAD = {
+    'data_id': 999999,
+    'Date': "2025-06-25",
+    'state': "online",
+    'battery_level': 85.5,
+    'battery_range': 280.0,
+    'ideal_battery_range': 300.0,
+    'est_battery_range': 275.0,
+    'usable_battery_level': 85.0,
+    'charge_limit_soc': 90.0,
+    'charging_state': "Disconnected",
+    'charge_rate': 0.0,
+    'charger_power': 0.0,
+    'charger_voltage': 0.0,
+    'charger_actual_current': 0.0,
+    'time_to_full_charge': 0.0,
+    'charge_energy_added': 0.0,
+    'charge_miles_added_rated': 0.0,
+    'inside_temp': 22.0,
+    'outside_temp': 25.0,
+    'driver_temp_setting': 21.0,
+    'passenger_temp_setting': 21.0,
+    'is_climate_on': False,
+    'is_preconditioning': False,
+    'latitude': 40.7128,
+    'longitude': -74.0060,
+    'speed': 0.0,
+    'heading': 0.0,
+    'odometer': 74565.0,
+    'shift_state': "P",
+    'locked': True,
+    'sentry_mode': False,
+    'valet_mode': False,
+    'car_version': "2024.20.1",
+    'tpms_front_left': 42.0,
+    'tpms_front_right': 42.0,
+    'tpms_rear_left': 40.0,
+    'tpms_rear_right': 40.0,
+    'location': "New York, NY",
+    'carState': "online",
+    'maxRange': 350.0,
+    'sleepNumber': 1,
+    'driveNumber': 1,
+    'chargeNumber': 1,
+    'idleNumber': 1,
+}
+
 @app.route('/api/add-test-data', methods=['GET'])
 def add_test_data():
     """Add some test data for demonstration"""
     try:
         # Check if we already have data
-        existing_count = TeslaData.query.count()
+        existing_count = get_stats().record_count
         if existing_count > 0:
             return jsonify({
                 "success": True,
@@ -640,55 +2060,13 @@ def add_test_data():
             })
         
         # Create test data
-        test_data = TeslaData(
-            data_id=999999,
-            date="2025-06-25",
-            state="online",
-            battery_level=85.5,
-            battery_range=280.0,
-            ideal_battery_range=300.0,
-            est_battery_range=275.0,
-            usable_battery_level=85.0,
-            charge_limit_soc=90.0,
-            charging_state="Disconnected",
-            charge_rate=0.0,
-            charger_power=0.0,
-            charger_voltage=0.0,
-            charger_actual_current=0.0,
-            time_to_full_charge=0.0,
-            charge_energy_added=0.0,
-            charge_miles_added_rated=0.0,
-            inside_temp=22.0,
-            outside_temp=25.0,
-            driver_temp_setting=21.0,
-            passenger_temp_setting=21.0,
-            is_climate_on=False,
-            is_preconditioning=False,
-            latitude=40.7128,
-            longitude=-74.0060,
-            speed=0.0,
-            heading=0.0,
-            odometer=74565.0,
-            shift_state="P",
-            locked=True,
-            sentry_mode=False,
-            valet_mode=False,
-            car_version="2024.20.1",
-            tpms_front_left=42.0,
-            tpms_front_right=42.0,
-            tpms_rear_left=40.0,
-            tpms_rear_right=40.0,
-            location="New York, NY",
-            car_state="online",
-            max_range=350.0,
-            sleep_number=1,
-            drive_number=1,
-            charge_number=1,
-            idle_number=1
-        )
+        test_data = TeslaData(**tesla_record_values(TEST_PAYLOAD))
         
         db.session.add(test_data)
+        db.session.flush()
+        update_derived_tables([test_data])
         db.session.commit()
+        mark_data_changed(test_data)
         
         return jsonify({
             "success": True,
@@ -757,272 +2135,6 @@ def widget_detail(widget_name):
     # You can add logic here to validate widget_name or customize the page
     return render_template('widget_detail.html', widget_name=widget_name)
 
-@app.route('/api/charts/climate')
-def climate_chart():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    start_time = request.args.get('start_time', '00:00:00')
-    end_time = request.args.get('end_time', '23:59:59')
-    if not start_date or not end_date:
-        since = datetime.now(timezone.utc) - timedelta(hours=1)
-        data = TeslaData.query.filter(TeslaData.timestamp >= since).order_by(TeslaData.timestamp).all()
-    else:
-        start_dt = datetime.strptime(f"{start_date} {start_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        end_dt = datetime.strptime(f"{end_date} {end_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        data = TeslaData.query.filter(
-            TeslaData.timestamp >= start_dt,
-            TeslaData.timestamp <= end_dt
-        ).order_by(TeslaData.timestamp).all()
-    sofia_tz = pytz.timezone('Europe/Sofia')
-    labels = [d.timestamp.replace(tzinfo=timezone.utc).astimezone(sofia_tz).strftime('%Y-%m-%d %H:%M') for d in data]
-    values = [1 if d.is_climate_on else 0 for d in data]
-    return jsonify({'success': True, 'data': {'labels': labels, 'values': values}})
-
-@app.route('/api/charts/vehicle_state')
-def vehicle_state_chart():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    start_time = request.args.get('start_time', '00:00:00')
-    end_time = request.args.get('end_time', '23:59:59')
-    if not start_date or not end_date:
-        since = datetime.now(timezone.utc) - timedelta(hours=1)
-        data = TeslaData.query.filter(TeslaData.timestamp >= since).order_by(TeslaData.timestamp).all()
-    else:
-        start_dt = datetime.strptime(f"{start_date} {start_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        end_dt = datetime.strptime(f"{end_date} {end_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        data = TeslaData.query.filter(
-            TeslaData.timestamp >= start_dt,
-            TeslaData.timestamp <= end_dt
-        ).order_by(TeslaData.timestamp).all()
-    sofia_tz = pytz.timezone('Europe/Sofia')
-    labels = [d.timestamp.replace(tzinfo=timezone.utc).astimezone(sofia_tz).strftime('%Y-%m-%d %H:%M') for d in data]
-    values = [1 if d.locked else 0 for d in data]
-    return jsonify({'success': True, 'data': {'labels': labels, 'values': values}})
-
-@app.route('/api/charts/sentry')
-def sentry_chart():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    start_time = request.args.get('start_time', '00:00:00')
-    end_time = request.args.get('end_time', '23:59:59')
-    if not start_date or not end_date:
-        since = datetime.now(timezone.utc) - timedelta(hours=1)
-        data = TeslaData.query.filter(TeslaData.timestamp >= since).order_by(TeslaData.timestamp).all()
-    else:
-        start_dt = datetime.strptime(f"{start_date} {start_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        end_dt = datetime.strptime(f"{end_date} {end_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        data = TeslaData.query.filter(
-            TeslaData.timestamp >= start_dt,
-            TeslaData.timestamp <= end_dt
-        ).order_by(TeslaData.timestamp).all()
-    sofia_tz = pytz.timezone('Europe/Sofia')
-    labels = [d.timestamp.replace(tzinfo=timezone.utc).astimezone(sofia_tz).strftime('%Y-%m-%d %H:%M') for d in data]
-    values = [1 if d.sentry_mode else 0 for d in data]
-    return jsonify({'success': True, 'data': {'labels': labels, 'values': values}})
-
-@app.route('/api/charts/valet')
-def valet_chart():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    start_time = request.args.get('start_time', '00:00:00')
-    end_time = request.args.get('end_time', '23:59:59')
-    if not start_date or not end_date:
-        since = datetime.now(timezone.utc) - timedelta(hours=1)
-        data = TeslaData.query.filter(TeslaData.timestamp >= since).order_by(TeslaData.timestamp).all()
-    else:
-        start_dt = datetime.strptime(f"{start_date} {start_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        end_dt = datetime.strptime(f"{end_date} {end_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        data = TeslaData.query.filter(
-            TeslaData.timestamp >= start_dt,
-            TeslaData.timestamp <= end_dt
-        ).order_by(TeslaData.timestamp).all()
-    sofia_tz = pytz.timezone('Europe/Sofia')
-    labels = [d.timestamp.replace(tzinfo=timezone.utc).astimezone(sofia_tz).strftime('%Y-%m-%d %H:%M') for d in data]
-    values = [1 if d.valet_mode else 0 for d in data]
-    return jsonify({'success': True, 'data': {'labels': labels, 'values': values}})
-
-@app.route('/api/charts/odometer')
-def odometer_chart():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    start_time = request.args.get('start_time', '00:00:00')
-    end_time = request.args.get('end_time', '23:59:59')
-    if not start_date or not end_date:
-        since = datetime.now(timezone.utc) - timedelta(hours=1)
-        data = TeslaData.query.filter(TeslaData.timestamp >= since).order_by(TeslaData.timestamp).all()
-    else:
-        start_dt = datetime.strptime(f"{start_date} {start_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        end_dt = datetime.strptime(f"{end_date} {end_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        data = TeslaData.query.filter(
-            TeslaData.timestamp >= start_dt,
-            TeslaData.timestamp <= end_dt
-        ).order_by(TeslaData.timestamp).all()
-    sofia_tz = pytz.timezone('Europe/Sofia')
-    labels = [d.timestamp.replace(tzinfo=timezone.utc).astimezone(sofia_tz).strftime('%Y-%m-%d %H:%M') for d in data]
-    values = [miles_to_km(d.odometer) for d in data]
-    return jsonify({'success': True, 'data': {'labels': labels, 'values': values}})
-
-@app.route('/api/charts/speed')
-def speed_chart():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    start_time = request.args.get('start_time', '00:00:00')
-    end_time = request.args.get('end_time', '23:59:59')
-    if not start_date or not end_date:
-        since = datetime.now(timezone.utc) - timedelta(hours=1)
-        data = TeslaData.query.filter(TeslaData.timestamp >= since).order_by(TeslaData.timestamp).all()
-    else:
-        start_dt = datetime.strptime(f"{start_date} {start_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        end_dt = datetime.strptime(f"{end_date} {end_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        data = TeslaData.query.filter(
-            TeslaData.timestamp >= start_dt,
-            TeslaData.timestamp <= end_dt
-        ).order_by(TeslaData.timestamp).all()
-    sofia_tz = pytz.timezone('Europe/Sofia')
-    labels = [d.timestamp.replace(tzinfo=timezone.utc).astimezone(sofia_tz).strftime('%Y-%m-%d %H:%M') for d in data]
-    values = [mph_to_kmh(d.speed) for d in data]
-    return jsonify({'success': True, 'data': {'labels': labels, 'values': values}})
-
-@app.route('/api/charts/location')
-def location_chart():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    start_time = request.args.get('start_time', '00:00:00')
-    end_time = request.args.get('end_time', '23:59:59')
-    if not start_date or not end_date:
-        since = datetime.now(timezone.utc) - timedelta(hours=1)
-        data = TeslaData.query.filter(TeslaData.timestamp >= since).order_by(TeslaData.timestamp).all()
-    else:
-        start_dt = datetime.strptime(f"{start_date} {start_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        end_dt = datetime.strptime(f"{end_date} {end_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        data = TeslaData.query.filter(
-            TeslaData.timestamp >= start_dt,
-            TeslaData.timestamp <= end_dt
-        ).order_by(TeslaData.timestamp).all()
-    sofia_tz = pytz.timezone('Europe/Sofia')
-    labels = [d.timestamp.replace(tzinfo=timezone.utc).astimezone(sofia_tz).strftime('%Y-%m-%d %H:%M') for d in data]
-    latitudes = [d.latitude for d in data]
-    longitudes = [d.longitude for d in data]
-    return jsonify({'success': True, 'data': {'labels': labels, 'latitudes': latitudes, 'longitudes': longitudes}})
-
-@app.route('/api/charts/battery_range')
-def battery_range_chart():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    start_time = request.args.get('start_time', '00:00:00')
-    end_time = request.args.get('end_time', '23:59:59')
-    
-    # Default to last hour if no dates provided
-    if not start_date or not end_date:
-        since = datetime.now(timezone.utc) - timedelta(hours=1)
-        data = TeslaData.query.filter(TeslaData.timestamp >= since).order_by(TeslaData.timestamp).all()
-    else:
-        # Parse date strings and combine with time for precise filtering
-        start_dt = datetime.strptime(f"{start_date} {start_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        end_dt = datetime.strptime(f"{end_date} {end_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        data = TeslaData.query.filter(
-            TeslaData.timestamp >= start_dt,
-            TeslaData.timestamp <= end_dt
-        ).order_by(TeslaData.timestamp).all()
-    
-    if not data:
-        return jsonify({'success': True, 'data': {'labels': [], 'battery_range': [], 'ideal_battery_range': [], 'est_battery_range': []}})
-    
-    # Convert UTC timestamps to Europe/Sofia timezone
-    sofia_tz = pytz.timezone('Europe/Sofia')
-    labels = [d.timestamp.replace(tzinfo=timezone.utc).astimezone(sofia_tz).strftime('%Y-%m-%d %H:%M') for d in data]
-    
-    # Convert battery ranges from miles to kilometers
-    battery_range = [miles_to_km(d.battery_range) for d in data]
-    ideal_battery_range = [miles_to_km(d.ideal_battery_range) for d in data]
-    est_battery_range = [miles_to_km(d.est_battery_range) for d in data]
-    
-    return jsonify({
-        'success': True, 
-        'data': {
-            'labels': labels,
-            'battery_range': battery_range,
-            'ideal_battery_range': ideal_battery_range,
-            'est_battery_range': est_battery_range
-        }
-    })
-
-@app.route('/api/charts/charging_details')
-def charging_details_chart():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    start_time = request.args.get('start_time', '00:00:00')
-    end_time = request.args.get('end_time', '23:59:59')
-    
-    # Default to last hour if no dates provided
-    if not start_date or not end_date:
-        since = datetime.now(timezone.utc) - timedelta(hours=1)
-        data = TeslaData.query.filter(TeslaData.timestamp >= since).order_by(TeslaData.timestamp).all()
-    else:
-        # Parse date strings and combine with time for precise filtering
-        start_dt = datetime.strptime(f"{start_date} {start_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        end_dt = datetime.strptime(f"{end_date} {end_time}", '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-        data = TeslaData.query.filter(
-            TeslaData.timestamp >= start_dt,
-            TeslaData.timestamp <= end_dt
-        ).order_by(TeslaData.timestamp).all()
-    
-    if not data:
-        return jsonify({'success': True, 'data': {'labels': [], 'charge_rate': [], 'charger_power': [], 'charger_voltage': [], 'charger_current': [], 'time_to_full': [], 'energy_added': []}})
-    
-    # Convert UTC timestamps to Europe/Sofia timezone
-    sofia_tz = pytz.timezone('Europe/Sofia')
-    labels = [d.timestamp.replace(tzinfo=timezone.utc).astimezone(sofia_tz).strftime('%Y-%m-%d %H:%M') for d in data]
-    
-    # Extract charging details
-    charge_rate = [d.charge_rate if d.charge_rate is not None else 0 for d in data]
-    charger_power = [d.charger_power if d.charger_power is not None else 0 for d in data]
-    charger_voltage = [d.charger_voltage if d.charger_voltage is not None else 0 for d in data]
-    charger_current = [d.charger_actual_current if d.charger_actual_current is not None else 0 for d in data]
-    time_to_full = [d.time_to_full_charge if d.time_to_full_charge is not None else 0 for d in data]
-    energy_added = [d.charge_energy_added if d.charge_energy_added is not None else 0 for d in data]
-    
-    return jsonify({
-        'success': True, 
-        'data': {
-            'labels': labels,
-            'charge_rate': charge_rate,
-            'charger_power': charger_power,
-            'charger_voltage': charger_voltage,
-            'charger_current': charger_current,
-            'time_to_full': time_to_full,
-            'energy_added': energy_added
-        }
-    })
-
-def safe_float(value):
-    """Safely convert value to float, return None if not possible"""
-    if value is None or value == '' or value == 'null':
-        return None
-    try:
-        return float(value)
-    except (ValueError, TypeError):
-        return None
-
-def safe_int(value):
-    """Safely convert value to int, return None if not possible"""
-    if value is None or value == '' or value == 'null':
-        return None
-    try:
-        return int(value)
-    except (ValueError, TypeError):
-        return None
-
-def safe_bool(value):
-    """Safely convert value to bool, return None if not possible"""
-    if value is None or value == '' or value == 'null':
-        return None
-    if isinstance(value, bool):
-        return value
-    if isinstance(value, str):
-        return value.lower() in ('true', '1', 'yes', 'on')
-    return bool(value)
-
 # Data ingestion script (can be run separately)
 def fetch_and_store_tesla_data():
     """Function to fetch data from TeslaFi API and store in database"""
@@ -1038,7 +2150,7 @@ def fetch_and_store_tesla_data():
             print(f"[{datetime.now()}] Fetching data from TeslaFi API...")
             # TeslaFi API endpoint (adjust URL based on your actual API endpoint)
             url = f"https://www.teslafi.com/feed.php?token={TESLAFI_API_TOKEN}&command=lastGood"
-            response = requests.get(url, timeout=30)
+            response = teslafi_client.get(url)
             
             print(f"[{datetime.now()}] TeslaFi API response status: {response.status_code}")
             
@@ -1047,62 +2159,25 @@ def fetch_and_store_tesla_data():
                 print(f"[{datetime.now()}] Successfully fetched data from TeslaFi (data_id: {data.get('data_id', 'unknown')})")
                 
                 # Check if data_id already exists to avoid duplicates
-                existing = TeslaData.query.filter_by(data_id=data.get('data_id')).first()
-                if existing:
+                if sample_stored(data.get('data_id')):
                     print(f"[{datetime.now()}] Data already exists (duplicate data_id: {data.get('data_id')})")
                     return {"status": "duplicate", "message": "Data already exists"}
                 
-                print(f"[{datetime.now()}] Creating new TeslaData record...")
-                # Create new record
-                tesla_record = TeslaData(
-                    data_id=data.get('data_id'),
-                    date=data.get('Date'),
-                    state=data.get('state'),
-                    battery_level=safe_float(data.get('battery_level')),
-                    battery_range=safe_float(data.get('battery_range')),
-                    ideal_battery_range=safe_float(data.get('ideal_battery_range')),
-                    est_battery_range=safe_float(data.get('est_battery_range')),
-                    usable_battery_level=safe_float(data.get('usable_battery_level')),
-                    charge_limit_soc=safe_float(data.get('charge_limit_soc')),
-                    charging_state=data.get('charging_state'),
-                    charge_rate=safe_float(data.get('charge_rate')),
-                    charger_power=safe_float(data.get('charger_power')),
-                    charger_voltage=safe_float(data.get('charger_voltage')),
-                    charger_actual_current=safe_float(data.get('charger_actual_current')),
-                    time_to_full_charge=safe_float(data.get('time_to_full_charge')),
-                    charge_energy_added=safe_float(data.get('charge_energy_added')),
-                    charge_miles_added_rated=safe_float(data.get('charge_miles_added_rated')),
-                    inside_temp=safe_float(data.get('inside_temp')),
-                    outside_temp=safe_float(data.get('outside_temp')),
-                    driver_temp_setting=safe_float(data.get('driver_temp_setting')),
-                    passenger_temp_setting=safe_float(data.get('passenger_temp_setting')),
-                    is_climate_on=safe_bool(data.get('is_climate_on')),
-                    is_preconditioning=safe_bool(data.get('is_preconditioning')),
-                    latitude=safe_float(data.get('latitude')),
-                    longitude=safe_float(data.get('longitude')),
-                    speed=safe_float(data.get('speed')),
-                    heading=safe_float(data.get('heading')),
-                    odometer=safe_float(data.get('odometer')),
-                    shift_state=data.get('shift_state'),
-                    locked=safe_bool(data.get('locked')),
-                    sentry_mode=safe_bool(data.get('sentry_mode')),
-                    valet_mode=safe_bool(data.get('valet_mode')),
-                    car_version=data.get('car_version'),
-                    tpms_front_left=safe_float(data.get('tpms_front_left')),
-                    tpms_front_right=safe_float(data.get('tpms_front_right')),
-                    tpms_rear_left=safe_float(data.get('tpms_rear_left')),
-                    tpms_rear_right=safe_float(data.get('tpms_rear_right')),
-                    location=data.get('location'),
-                    car_state=data.get('carState'),
-                    max_range=safe_float(data.get('maxRange')),
-                    sleep_number=safe_int(data.get('sleepNumber')),
-                    drive_number=safe_int(data.get('driveNumber')),
-                    charge_number=safe_int(data.get('chargeNumber')),
-                    idle_number=safe_int(data.get('idleNumber'))
-                )
+                print(f"[{datetime.now()}] Spooling new TeslaData record...")
+                # On disk before anything else can fail; the spool writer commits it
+                position = spool_payloads([data])
+                if not ingest_spool.wait(position, SPOOL_COMMIT_WAIT):
+                    print(f"[{datetime.now()}] Data spooled, not committed yet (data_id: {data.get('data_id')})")
+                    return {"status": "queued", "message": "Data spooled, not committed yet", "data_id": data.get('data_id')}
+                if not sample_stored(data.get('data_id')):
+                    print(f"[{datetime.now()}] ERROR: Data could not be stored (data_id: {data.get('data_id')})")
+                    return {"status": "error", "message": "Data could not be stored, see the spool's dead-letter file"}
                 
-                db.session.add(tesla_record)
-                db.session.commit()
+                try:
+                    fill_open_gaps(TESLAFI_API_TOKEN)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"[{datetime.now()}] ERROR filling gaps: {e}")
                 
                 print(f"[{datetime.now()}] SUCCESS: Data stored successfully with data_id: {data.get('data_id')}")
                 return {"status": "success", "message": "Data stored successfully", "data_id": data.get('data_id')}
@@ -1130,8 +2205,29 @@ scheduler_running = False
 last_run_time = None
 next_run_time = None
 
+# Poll cadence follows the car: fast while driving or charging, slow while asleep
+poll_policy = PollPolicy.from_env()
+if GAP_THRESHOLD_MINUTES is not None:
+    clamped = poll_policy.clamp_gap_threshold(GAP_THRESHOLD_MINUTES, GAP_MARGIN_MINUTES)
+    if clamped != GAP_THRESHOLD_MINUTES:
+        print(f"[{datetime.now()}] WARNING: GAP_THRESHOLD_MINUTES={GAP_THRESHOLD_MINUTES} is shorter than the longest poll "
+              f"interval ({max(poll_policy.intervals.values())}s), using {clamped} minutes")
+        GAP_THRESHOLD_MINUTES = clamped
+poll_mode = 'unknown'
+poll_interval = poll_policy.intervals['unknown']
+# Set to cut the scheduler's wait short, e.g. when it is stopped
+scheduler_wakeup = threading.Event()
+
+def latest_poll_state():
+    """State codes of the newest stored sample, None before any data"""
+    row = db.session.execute(
+        select(TeslaData.state_code, TeslaData.car_state_code, TeslaData.charging_state_code, TeslaData.shift_state_code)
+        .order_by(desc(TeslaData.timestamp)).limit(1)
+    ).first()
+    return row._mapping if row is not None else None
+
 def automatic_data_ingestion():
-    """Automatically fetch and store Tesla data every 5 minutes"""
+    """Automatically fetch and store Tesla data on the scheduler's cadence"""
     try:
         print(f"[{datetime.now()}] Starting automatic data ingestion on Railway...")
         
@@ -1150,6 +2246,8 @@ def automatic_data_ingestion():
             print(f"[{datetime.now()}] SUCCESS: Data ingested with data_id: {result.get('data_id')}")
         elif result.get('status') == 'duplicate':
             print(f"[{datetime.now()}] INFO: Data already exists (duplicate)")
+        elif result.get('status') == 'queued':
+            print(f"[{datetime.now()}] INFO: Data spooled, the writer will commit it")
         else:
             print(f"[{datetime.now()}] ERROR: Ingestion failed - {result}")
         
@@ -1160,73 +2258,67 @@ def automatic_data_ingestion():
         traceback.print_exc()
         return {"status": "error", "message": str(e)}
 
-def scheduler_worker():
-    """Background thread that runs data ingestion at exact 5-minute intervals"""
-    global scheduler_running, last_run_time, next_run_time
+def scheduler_worker(run_now=False):
+    """Background thread that runs data ingestion at the cadence chosen by the poll policy"""
+    global scheduler_running, last_run_time, next_run_time, poll_mode, poll_interval
     
     print(f"[{datetime.now()}] Scheduler worker started")
     scheduler_running = True
+    result = None
     
     with app.app_context():
         while scheduler_running:
             try:
-                now = datetime.now()
-                
-                # Calculate next run time (at exact 5-minute boundaries)
-                # Find the next 5-minute mark from now
-                current_minute = now.minute
-                current_second = now.second
+                if run_now:
+                    # The first fetch after startup or failover runs right away, in this thread
+                    run_now = False
+                    print(f"[{datetime.now()}] ===== EXECUTING INITIAL DATA INGESTION =====")
+                    last_run_time = datetime.now()
+                    result = automatic_data_ingestion()
+                    print(f"[{datetime.now()}] Initial data ingestion result: {result}")
+                    continue
                 
-                # Calculate minutes to next 5-minute boundary
-                minutes_to_next = 5 - (current_minute % 5)
-                if minutes_to_next == 5:
-                    minutes_to_next = 0
-                
-                # If we're at the exact minute boundary and seconds are 0, run immediately
-                if current_minute % 5 == 0 and current_second < 10:
-                    print(f"[{datetime.now()}] At exact minute boundary, running immediately")
-                    next_run = now
+                # Pick the interval from the newest sample; a failed poll falls back to the 'unknown' cadence
+                if result is not None and result.get('status') == 'error':
+                    poll_mode, poll_interval = 'unknown', poll_policy.intervals['unknown']
                 else:
-                    # Set next run time to exact minute boundary
-                    next_run = now.replace(second=0, microsecond=0) + timedelta(minutes=minutes_to_next)
+                    poll_mode, poll_interval = poll_policy.next_poll(latest_poll_state())
+                db.session.remove()
                 
+                # Runs land on wall-clock multiples of the interval (every 5 minutes on :00, :05, ...)
+                now = datetime.now()
+                next_run = next_boundary(now, poll_interval)
                 next_run_time = next_run
                 
-                print(f"[{datetime.now()}] Current time: {now}")
-                print(f"[{datetime.now()}] Next scheduled run: {next_run}")
+                print(f"[{datetime.now()}] Poll mode: {poll_mode}, interval {poll_interval}s, next scheduled run: {next_run}")
                 
                 # Wait until next run time
-                time_to_wait = (next_run - now).total_seconds()
-                if time_to_wait > 0:
-                    print(f"[{datetime.now()}] Waiting {time_to_wait:.1f} seconds until next run")
-                    time.sleep(time_to_wait)
+                scheduler_wakeup.wait((next_run - now).total_seconds())
+                scheduler_wakeup.clear()
+                if not scheduler_running:
+                    break
                 
                 # Execute data ingestion
                 print(f"[{datetime.now()}] ===== EXECUTING SCHEDULED DATA INGESTION =====")
                 last_run_time = datetime.now()
                 
-                # Check if TESLAFI_API_TOKEN is available
-                teslafi_token = os.environ.get('TESLAFI_API_TOKEN')
-                print(f"[{datetime.now()}] TESLAFI_API_TOKEN available: {bool(teslafi_token)}")
-                
                 result = automatic_data_ingestion()
                 print(f"[{datetime.now()}] ===== SCHEDULED INGESTION RESULT: {result} =====")
                 
-                # Wait a bit before calculating next run time
-                time.sleep(10)
-                
             except Exception as e:
                 print(f"[{datetime.now()}] CRITICAL ERROR in scheduler worker: {e}")
                 import traceback
                 traceback.print_exc()
+                db.session.rollback()
                 time.sleep(60)  # Wait a minute before retrying
 
-def start_scheduler():
-    """Start the background scheduler thread"""
+def start_scheduler(run_now=False):
+    """Start the background scheduler thread, optionally fetching once right away"""
     global scheduler_thread, scheduler_running
     
     if scheduler_thread is None or not scheduler_thread.is_alive():
-        scheduler_thread = threading.Thread(target=scheduler_worker, daemon=True)
+        scheduler_wakeup.clear()
+        scheduler_thread = threading.Thread(target=scheduler_worker, args=(run_now,), daemon=True)
         scheduler_thread.start()
         print(f"[{datetime.now()}] Scheduler thread started")
     else:
@@ -1236,24 +2328,126 @@ def stop_scheduler():
     """Stop the background scheduler thread"""
     global scheduler_running
     scheduler_running = False
+    scheduler_wakeup.set()
     print(f"[{datetime.now()}] Scheduler stop requested")
 
-# Start the scheduler when the app starts
-print(f"[{datetime.now()}] Starting Tesla data ingestion scheduler...")
-start_scheduler()
+class IngestLease(db.Model):
+    """Lease row naming the one process that runs the ingestion scheduler"""
+    __tablename__ = 'tesla_leases'
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+# Leader election: 'file' (one host, default for SQLite), 'database' (lease row, default for PostgreSQL)
+# or 'none' to let every process ingest
+LEADER_ELECTION = os.environ.get('LEADER_ELECTION') or (
+    'database' if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres') else 'file'
+)
+LEADER_LOCK_FILE = os.environ.get('LEADER_LOCK_FILE', os.path.join(os.environ.get('TMPDIR', '/tmp'), 'tesla_vis_ingest.lock'))
+LEADER_LEASE_SECONDS = int(os.environ.get('LEADER_LEASE_SECONDS', '60'))
+# The leader renews and followers retry this often, so a dead leader is replaced within one lease
+LEADER_RENEW_SECONDS = LEADER_LEASE_SECONDS / 3
+
+if LEADER_ELECTION == 'database':
+    leader_lease = DatabaseLease(db, IngestLease, ttl=LEADER_LEASE_SECONDS)
+elif LEADER_ELECTION == 'file':
+    leader_lease = FileLease(LEADER_LOCK_FILE)
+else:
+    leader_lease = None
 
-# Also run once immediately on startup
-print(f"[{datetime.now()}] Running initial data ingestion...")
-try:
-    initial_result = automatic_data_ingestion()
-    print(f"[{datetime.now()}] Initial data ingestion result: {initial_result}")
-except Exception as e:
-    print(f"[{datetime.now()}] ERROR in initial data ingestion: {e}")
+is_leader = False
+leader_thread = None
+
+def elect_leader():
+    """One election round: take or renew the lease and start or stop the scheduler when leadership changes"""
+    global is_leader
+    if leader_lease is None:
+        leading = True
+    else:
+        try:
+            leading = leader_lease.acquire()
+        except Exception as e:
+            # Can't confirm the lease, so stop ingesting rather than risk two leaders
+            print(f"[{datetime.now()}] ERROR in leader election: {e}")
+            db.session.rollback()
+            leading = False
+
+    if leading and not is_leader:
+        is_leader = True
+        print(f"[{datetime.now()}] Process {process_id()} is now the ingestion leader ({LEADER_ELECTION})")
+        start_scheduler(run_now=True)
+        return True
+    if not leading and is_leader:
+        is_leader = False
+        print(f"[{datetime.now()}] Process {process_id()} lost ingestion leadership, stopping scheduler")
+        stop_scheduler()
+    return False
+
+def leader_election_worker():
+    """Background thread that keeps renewing (or retrying for) the leader lease"""
+    with app.app_context():
+        while True:
+            time.sleep(LEADER_RENEW_SECONDS)
+            elect_leader()
+            db.session.remove()
+
+def release_leadership():
+    """Hand the lease back on a clean shutdown so a follower takes over without waiting for it to expire"""
+    if leader_lease is None or not is_leader:
+        return
+    try:
+        with app.app_context():
+            leader_lease.release()
+    except Exception as e:
+        print(f"[{datetime.now()}] ERROR releasing leader lease: {e}")
+
+def leader_status():
+    """Leadership details for /api/ingest/status"""
+    holder = process_id() if leader_lease is None else None
+    if leader_lease is not None:
+        try:
+            holder = leader_lease.holder()
+        except Exception as e:
+            holder = f"unknown ({e})"
+    return {
+        "election": LEADER_ELECTION,
+        "process": process_id(),
+        "is_leader": is_leader,
+        "leader": holder,
+    }
+
+def start_ingestion_services():
+    """Start the spool writer and join the leader election; the leader runs the scheduler, fetching right away"""
+    global leader_thread
+    if leader_thread is not None:
+        return
+    # Commit whatever an earlier run spooled but did not get to store
+    ensure_spool_writer()
+    print(f"[{datetime.now()}] Electing Tesla data ingestion leader...")
+    with app.app_context():
+        if not elect_leader():
+            print(f"[{datetime.now()}] Process {process_id()} is following, ingestion runs in the leader")
+        db.session.remove()
+    leader_thread = threading.Thread(target=leader_election_worker, daemon=True)
+    leader_thread.start()
+    atexit.register(release_leadership)
 
 if __name__ == '__main__':
+    import sys
+    
+    if len(sys.argv) > 1 and sys.argv[1] == 'ingest':
+        # Dedicated ingestion service, no web server
+        start_ingestion_services()
+        while True:
+            time.sleep(3600)
+    
     with app.app_context():
         db.create_all()
     
+    # With the reloader only the child process serves requests, so only it ingests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_ingestion_services()
+    
     # Uncomment the line below to test data ingestion
     # fetch_and_store_tesla_data()
     
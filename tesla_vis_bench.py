@@ -0,0 +1,655 @@
+#!/usr/bin/env python3
+"""
+Tesla Dashboard Benchmarks
+Compares hot paths against the implementations they replaced, on a throwaway SQLite database.
+"""
+
+import os
+import sys
+import math
+import itertools
+import time
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+BENCH_DB = os.path.join(tempfile.gettempdir(), 'tesla_vis_bench.db')
+
+def load_app():
+    """Import tesla_vis against the benchmark database"""
+    os.environ['DATABASE_URL'] = f'sqlite:///{BENCH_DB}'
+    os.environ['SPOOL_DIR'] = BENCH_DB + '.spool'
+    import tesla_vis
+    with tesla_vis.app.app_context():
+        tesla_vis.db.create_all()
+    return tesla_vis
+
+def seed_year(tv, days=365, minutes=5):
+    """Fill the benchmark database with one sample every `minutes` for `days` days"""
+    with tv.app.app_context():
+        # Other benchmarks store their own samples in future windows, only past rows count as the seeded year
+        if tv.TeslaData.query.filter(tv.TeslaData.timestamp <= datetime.utcnow()).count():
+            return
+        start = datetime.utcnow() - timedelta(days=days)
+        rows = []
+        for i in range(days * 24 * 60 // minutes):
+            ts = start + timedelta(minutes=i * minutes)
+            rows.append({
+                'data_id': i + 1,
+                'timestamp': ts,
+                'date': ts.strftime('%Y-%m-%d %H:%M:%S'),
+                'state': 'online',
+                'battery_level': 50 + 30 * math.sin(i / 200),
+                'battery_range': 200 + 50 * math.sin(i / 200),
+                'outside_temp': 15 + 10 * math.sin(i / 288),
+                'inside_temp': 21.0,
+                'charging_state': 'Charging' if (i // 100) % 4 == 0 else 'Disconnected',
+                'tpms_front_left': 42.0,
+                'tpms_front_right': 42.5,
+                'tpms_rear_left': 41.0,
+                'tpms_rear_right': 41.5,
+                'odometer': 10000 + i * 0.05,
+                'speed': float(i % 80),
+                'locked': bool(i % 2),
+            })
+        tv.db.session.execute(tv.TeslaData.__table__.insert(), rows)
+        tv.db.session.commit()
+        print(f"Seeded {len(rows)} rows into {BENCH_DB}")
+
+def unused_data_ids(tv, first, limit):
+    """data_ids counting up from first (below limit), past any stored by earlier runs of the benchmark"""
+    import itertools
+    with tv.app.app_context():
+        stored = tv.db.session.scalar(
+            tv.select(tv.func.max(tv.func.coalesce(tv.TeslaData.last_data_id, tv.TeslaData.data_id)))
+            .where(tv.TeslaData.data_id >= first, tv.TeslaData.data_id < limit)
+        )
+    return itertools.count(first if stored is None else stored + 1)
+
+def future_clock(tv, start, step=timedelta(seconds=30)):
+    """Sample times from start (a future year), past any stored by earlier runs, so the seeded year stays untouched"""
+    with tv.app.app_context():
+        stored = tv.db.session.scalar(
+            tv.select(tv.func.max(tv.func.coalesce(tv.TeslaData.valid_until, tv.TeslaData.timestamp)))
+            .where(tv.TeslaData.timestamp >= start, tv.TeslaData.timestamp < start.replace(year=start.year + 1))
+        )
+    if isinstance(stored, str):
+        stored = datetime.fromisoformat(stored)
+    first = start if stored is None else stored + step
+    return (first + step * i for i in itertools.count())
+
+def measure(fn, repeat=3):
+    """Best wall time and peak traced memory of fn()"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+def report(name, legacy, current):
+    (legacy_time, legacy_peak), (current_time, current_peak) = legacy, current
+    print(f"{name}")
+    print(f"  legacy : {legacy_time * 1000:9.1f} ms  peak {legacy_peak / 1e6:8.1f} MB")
+    print(f"  current: {current_time * 1000:9.1f} ms  peak {current_peak / 1e6:8.1f} MB")
+    print(f"  speedup: {legacy_time / current_time:9.1f}x  memory {legacy_peak / max(current_peak, 1):6.1f}x less")
+
+def bench_charts():
+    """One-year tire pressure chart: ORM rows + per-row labels versus projected NumPy columns"""
+    import pytz
+    tv = load_app()
+    seed_year(tv)
+
+    start_dt = datetime.now(timezone.utc) - timedelta(days=366)
+    end_dt = datetime.now(timezone.utc)
+
+    def legacy():
+        # The handler as it was before the column engine
+        data = tv.TeslaData.query.filter(
+            tv.TeslaData.timestamp >= start_dt,
+            tv.TeslaData.timestamp <= end_dt
+        ).order_by(tv.TeslaData.timestamp).all()
+        sofia_tz = pytz.timezone('Europe/Sofia')
+        labels = [d.timestamp.replace(tzinfo=timezone.utc).astimezone(sofia_tz).strftime('%Y-%m-%d %H:%M') for d in data]
+        series = {
+            'front_left': [tv.psi_to_bar(d.tpms_front_left) for d in data],
+            'front_right': [tv.psi_to_bar(d.tpms_front_right) for d in data],
+            'rear_left': [tv.psi_to_bar(d.tpms_rear_left) for d in data],
+            'rear_right': [tv.psi_to_bar(d.tpms_rear_right) for d in data],
+        }
+        tv.db.session.expunge_all()
+        return labels, series
+
+    def current():
+        columns, _ = tv.chart_columns(['tire_pressure'])
+        ms, arrays = tv.query_chart_columns(start_dt, end_dt, columns)
+        return tv.build_chart_data('tire_pressure', ms, arrays)
+
+    # max_points=0 so both paths return every row and only the engines are compared
+    with tv.app.test_request_context('/api/charts/tire_pressure?max_points=0'):
+        legacy_labels, _ = legacy()
+        current_data = current()
+        assert legacy_labels == current_data['labels'], "label mismatch between legacy and current path"
+        print(f"Rows per series: {len(legacy_labels)}")
+        report('tire_pressure, 1 year', measure(legacy), measure(current))
+
+def bench_history():
+    """One year of /api/data/history: buffered JSON list versus the NDJSON stream"""
+    tv = load_app()
+    seed_year(tv)
+    client = tv.app.test_client()
+
+    def legacy():
+        return client.get('/api/data/history?days=366').get_data()
+
+    def current():
+        # Drain the stream chunk by chunk like a client would
+        response = client.get('/api/data/history?days=366&format=ndjson', buffered=False)
+        size = sum(len(chunk) for chunk in response.response)
+        response.close()
+        return size
+
+    report('history, 1 year', measure(legacy), measure(current))
+
+def bench_binary():
+    """One-year chart responses without downsampling: JSON versus binary chart blocks"""
+    tv = load_app()
+    seed_year(tv)
+    client = tv.app.test_client()
+    start = (datetime.utcnow() - timedelta(days=366)).strftime('%Y-%m-%d')
+    end = (datetime.utcnow() + timedelta(days=1)).strftime('%Y-%m-%d')
+
+    for metric in ['battery', 'tire_pressure', 'charging_details']:
+        url = f'/api/charts/{metric}?start_date={start}&end_date={end}&max_points=0'
+        # Clear the response cache so every run renders the response again
+        def fetch(url=url):
+            tv.response_cache.clear()
+            return client.get(url).get_data()
+
+        json_size = len(fetch())
+        binary_size = len(fetch(url + '&format=bin'))
+        report(f'{metric}, 1 year', measure(fetch), measure(lambda: fetch(url + '&format=bin')))
+        print(f"  size   : {json_size / 1e6:9.2f} MB JSON, {binary_size / 1e6:.2f} MB binary ({json_size / binary_size:.1f}x smaller)")
+
+def bench_usage():
+    """One-year usage breakdown: classifying ORM rows in Python versus CASE + GROUP BY"""
+    from collections import Counter
+    tv = load_app()
+    seed_year(tv)
+    start_dt = datetime.now(timezone.utc) - timedelta(days=366)
+    end_dt = datetime.now(timezone.utc)
+
+    def legacy():
+        # The loop as it was before the SQL aggregation
+        data = tv.TeslaData.query.filter(
+            tv.TeslaData.timestamp >= start_dt,
+            tv.TeslaData.timestamp <= end_dt
+        ).order_by(tv.TeslaData.timestamp).all()
+        counts = Counter()
+        for record in data:
+            if record.date:
+                if record.charging_state and 'charging' in record.charging_state.lower():
+                    counts['charge'] += 1
+                elif record.shift_state and record.shift_state in ['D', 'R']:
+                    counts['drive'] += 1
+                elif record.state and 'sleep' in record.state.lower():
+                    counts['sleep'] += 1
+                else:
+                    counts['idle'] += 1
+        tv.db.session.expunge_all()
+        return dict(counts)
+
+    def current():
+        kind = tv.usage_kind().label('kind')
+        rows = tv.db.session.execute(
+            tv.select(kind, tv.func.count()).where(
+                tv.TeslaData.timestamp >= start_dt,
+                tv.TeslaData.timestamp <= end_dt
+            ).group_by(kind)
+        ).all()
+        return {k: n for k, n in rows if k is not None}
+
+    with tv.app.app_context():
+        assert legacy() == current(), "usage counts differ between legacy and current path"
+        report('usage_stats, 1 year', measure(legacy), measure(current))
+
+def bench_ingest():
+    """Ingesting 2000 TeslaFi payloads: one POST per record versus /api/ingest/batch"""
+    tv = load_app()
+    client = tv.app.test_client()
+    # Fresh data_ids for every run, well above the seeded ones
+    next_id = unused_data_ids(tv, 10_000_000, 20_000_000)
+    # Batch records are timed by their Date: a future year keeps them out of the seeded one
+    clock = future_clock(tv, datetime(2035, 1, 1))
+
+    def payloads(count=2000):
+        return [{
+            'data_id': next(next_id),
+            'Date': next(clock).strftime('%Y-%m-%d %H:%M:%S'),
+            'state': 'online',
+            'battery_level': '72',
+            'outside_temp': '14.5',
+            'charging_state': 'Disconnected',
+            'shift_state': 'P',
+            'carState': 'Idling',
+            'idleNumber': '1',
+            'tpms_front_left': '42.0',
+        } for _ in range(count)]
+
+    def legacy():
+        for payload in payloads():
+            client.post('/api/ingest', json=payload)
+
+    def current():
+        result = client.post('/api/ingest/batch', json=payloads()).get_json()
+        assert result['inserted'] == 2000, result
+
+    report('ingest, 2000 records', measure(legacy), measure(current))
+
+def bench_mapper():
+    """Per-record TeslaFi payload conversion: a safe_* call per field versus the compiled mapper"""
+    from tesla_vis_fields import (BOOL, FLOAT, INT, TESLAFI_FIELDS, safe_bool, safe_float, safe_int,
+                                  tesla_record_values)
+    payload = {
+        key: {FLOAT: '42.5', INT: '17', BOOL: 'True'}.get(kind, 'online')
+        for _, key, kind in TESLAFI_FIELDS
+    }
+    payload['charge_rate'] = ''
+    payload['speed'] = None
+    payloads = [payload] * 100_000
+
+    # The literal {column: safe_*(data.get(key)), ...} expression the TeslaData(...) constructors used
+    calls = {FLOAT: 'safe_float', INT: 'safe_int', BOOL: 'safe_bool'}
+    source = 'lambda data: {' + ', '.join(
+        f"{column!r}: {calls.get(kind, '')}(data.get({key!r}))" for column, key, kind in TESLAFI_FIELDS
+    ) + '}'
+    legacy_values = eval(source, {'safe_float': safe_float, 'safe_int': safe_int, 'safe_bool': safe_bool})
+    assert legacy_values(payload) == tesla_record_values(payload), "mapper output differs from safe_* calls"
+
+    def legacy():
+        for data in payloads:
+            legacy_values(data)
+
+    def current():
+        for data in payloads:
+            tesla_record_values(data)
+
+    legacy_result, current_result = measure(legacy), measure(current)
+    report('mapper, 100k records', legacy_result, current_result)
+    per_record = lambda seconds: seconds / len(payloads) * 1e6
+    print(f"  per rec: {per_record(legacy_result[0]):9.2f} us legacy, {per_record(current_result[0]):.2f} us compiled")
+
+def bench_http():
+    """200 polls of a local keep-alive server: requests.get per call versus the pooled client"""
+    import threading
+    import requests
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from tesla_vis_http import HttpClient
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body go out as separate writes; without this delayed ACKs add 40 ms per kept-alive request
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            body = b'{"data_id": 1}'
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/feed.php'
+    client = HttpClient('bench')
+
+    def legacy():
+        # A new connection for every poll, as the module-level requests.get calls made
+        for _ in range(200):
+            requests.get(url, timeout=30).json()
+
+    def current():
+        for _ in range(200):
+            client.get(url).json()
+
+    report('http, 200 polls (plain HTTP, no TLS handshake saved)', measure(legacy), measure(current))
+    print(f"  client : {client.stats()}")
+    server.shutdown()
+
+def bench_spool():
+    """1000 fetched samples: an ORM add and commit per sample versus the spool and its batching writer"""
+    tv = load_app()
+    next_id = unused_data_ids(tv, 20_000_000, 30_000_000)
+    # Each path in its own future year: "now" would land inside the seeded year that bench_charts compares
+    clocks = {'legacy': future_clock(tv, datetime(2033, 1, 1)), 'current': future_clock(tv, datetime(2034, 1, 1))}
+
+    def payloads(count=1000):
+        return [{
+            'data_id': next(next_id),
+            'Date': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+            'state': 'online',
+            'battery_level': '72',
+            'charging_state': 'Disconnected',
+            'shift_state': 'P',
+        } for _ in range(count)]
+
+    def legacy():
+        # What fetch_and_store_tesla_data did for every sample
+        with tv.app.app_context():
+            for payload in payloads():
+                record = tv.TeslaData(**tv.tesla_record_values(payload), timestamp=next(clocks['legacy']))
+                mark = tv.high_water_mark()
+                tv.db.session.add(record)
+                tv.db.session.flush()
+                tv.update_derived_tables([record])
+                tv.record_gap(mark, record)
+                tv.db.session.commit()
+                tv.mark_data_changed(record)
+
+    def current():
+        # Each sample is fsynced to the spool on its own (as spool_payloads does, with a future arrival time);
+        # the writer commits whatever has piled up per round
+        position = None
+        for payload in payloads():
+            entry = {"received_at": next(clocks['current']).isoformat(), "payload": payload}
+            position = tv.ingest_spool.append([entry])
+            tv.ensure_spool_writer()
+        assert tv.ingest_spool.wait(position, 60), "spool writer did not catch up"
+
+    with tv.app.app_context():
+        journal_mode = tv.db.session.execute(tv.text('PRAGMA journal_mode')).scalar()
+    report(f'spool, 1000 samples (journal_mode={journal_mode})', measure(legacy), measure(current))
+    print(f"  spool  : {tv.spool_status()}")
+
+def parked_fortnight(start, first_data_id):
+    """Two weeks of 5-minute samples for a commuter car: two 30-minute drives and a 2-hour charge a day, parked otherwise"""
+    samples = []
+    battery, odometer = 80.0, 20000.0
+    for i in range(14 * 288):
+        minute_of_day = i % 288 * 5
+        payload = {'data_id': first_data_id + i, 'state': 'online', 'carState': 'Idling', 'shift_state': 'P',
+                   'charging_state': 'Disconnected', 'inside_temp': '19', 'outside_temp': '12', 'locked': '1'}
+        if 480 <= minute_of_day < 510 or 1050 <= minute_of_day < 1080:
+            battery -= 0.4
+            odometer += 2.5
+            payload.update(carState='Driving', shift_state='D', speed=str(30 + i % 40), locked='0', inside_temp='21')
+        elif 120 <= minute_of_day < 240:
+            battery = min(battery + 0.5, 80.0)
+            payload.update(charging_state='Charging', charger_power='7', charge_energy_added=str(minute_of_day - 120))
+        elif minute_of_day < 120 or minute_of_day >= 1380:
+            payload.update(state='asleep', carState='Sleeping')
+        payload.update(battery_level=f"{battery:.1f}", odometer=f"{odometer:.1f}")
+        samples.append((start + timedelta(minutes=i * 5), payload))
+    return samples
+
+def bench_compaction():
+    """Two parked-heavy weeks stored one row per sample versus run-length compacted, and a chart scan over each"""
+    tv = load_app()
+    windows = {'legacy': (datetime(2031, 1, 1), 30_000_000, False), 'current': (datetime(2032, 1, 1), 40_000_000, True)}
+    columns = ['battery_level', 'charger_power', 'speed', 'outside_temp']
+    rows = {}
+    with tv.app.app_context():
+        for name, (start, first_data_id, compact) in windows.items():
+            end = start + timedelta(days=14)
+            stored = tv.TeslaData.query.filter(tv.TeslaData.timestamp >= start, tv.TeslaData.timestamp < end)
+            if not stored.count():
+                chunk = []
+                for timestamp, payload in parked_fortnight(start, first_data_id):
+                    values = tv.tesla_record_values(payload)
+                    values['timestamp'] = timestamp
+                    chunk.append(values)
+                for i in range(0, len(chunk), 288):
+                    tv.store_ingest_chunk(chunk[i:i + 288], compact=compact)
+            rows[name] = stored.count()
+
+        # Re-posting samples folded into older runs must not store them again
+        start, first_data_id, _ = windows['current']
+        runs = tv.TeslaData.query.filter(tv.TeslaData.timestamp >= start, tv.TeslaData.sample_count > 1).all()
+        folded = {run.last_data_id for run in runs} | {(run.data_id + run.last_data_id) // 2 + 1 for run in runs}
+        replay = [(timestamp, payload) for timestamp, payload in parked_fortnight(start, first_data_id)
+                  if payload['data_id'] in folded]
+        samples = tv.get_stats().record_count
+        tv.store_ingest_chunk([dict(tv.tesla_record_values(payload), timestamp=timestamp) for timestamp, payload in replay],
+                              detect_gaps=True, compact=True)
+        result = tv.app.test_client().post('/api/ingest/batch', json=[payload for _, payload in replay]).get_json()
+        tv.db.session.expire_all()
+        assert result['inserted'] == 0 and result['duplicate'] == len(replay), result
+        current = tv.TeslaData.query.filter(tv.TeslaData.timestamp >= start, tv.TeslaData.timestamp < start + timedelta(days=14))
+        assert (current.count(), tv.get_stats().record_count) == (rows['current'], samples), "folded samples stored twice"
+
+        def scan(name):
+            start = windows[name][0].replace(tzinfo=timezone.utc)
+            return lambda: tv.query_chart_columns(start, start + timedelta(days=14), columns)
+
+        report(f"compaction, 14 days of 5-minute samples ({rows['legacy']} rows -> {rows['current']} rows)",
+               measure(scan('legacy')), measure(scan('current')))
+        points = {name: len(scan(name)()[0]) for name in windows}
+    print(f"  rows   : {rows['current'] / rows['legacy']:9.1%} of uncompacted, chart points {points['current']} vs {points['legacy']}")
+
+def bench_influx():
+    """1000 samples to a line-protocol stand-in for InfluxDB: a synchronous write each versus the batching writer"""
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    received = {'requests': 0, 'lines': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        # /api/v2/write accepting line protocol, with the latency of a local InfluxDB container
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            received['requests'] += 1
+            received['lines'] += body.count(b'\n') + 1
+            time.sleep(0.002)
+            self.send_response(204)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['INFLUXDB_URL'] = f'http://127.0.0.1:{server.server_address[1]}'
+    from tesla_influxdb import TeslaInfluxDB
+    influx = TeslaInfluxDB()
+    influx.logger.setLevel('WARNING')
+
+    start = datetime.utcnow()
+    samples = [{
+        'data_id': i, 'timestamp': start + timedelta(seconds=i * 30), 'battery_level': 70 + i % 10,
+        'battery_range_km': 350.5, 'inside_temp_c': 21.0, 'outside_temp_c': 12.5, 'speed_kmh': float(i % 90),
+        'odometer_km': 32000 + i * 0.2, 'state': 'online', 'charging_state': 'Disconnected', 'location': 'Home',
+    } for i in range(1000)]
+
+    def legacy():
+        for sample in samples:
+            influx.store_tesla_data(sample)
+
+    def current():
+        for sample in samples:
+            influx.enqueue_tesla_data(sample)
+        assert influx.batch_writer.flush(60), "batch writer did not drain"
+
+    report('influx, 1000 samples to a line-protocol stand-in (2 ms per request)', measure(legacy), measure(current))
+    print(f"  writer : {influx.stats()}")
+    print(f"  server : {received['requests']} requests, {received['lines']} lines")
+    influx.close()
+    server.shutdown()
+    del os.environ['INFLUXDB_URL']
+
+def flux_csv(count, fields, annotated):
+    """A pivoted Flux query response: one row per 30 s with a double per field"""
+    start = datetime(2026, 1, 1)
+    lines = []
+    if annotated:
+        lines.append('#datatype,string,long,dateTime:RFC3339,' + ','.join(['double'] * len(fields)))
+        lines.append('#group,false,false,false,' + ','.join(['false'] * len(fields)))
+        lines.append('#default,_result,,,' + ',' * (len(fields) - 1))
+    lines.append(',result,table,_time,' + ','.join(fields))
+    result = '' if annotated else '_result'
+    for i in range(count):
+        timestamp = (start + timedelta(seconds=30 * i)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        lines.append(f',{result},0,{timestamp},' + ','.join(f'{50 + (i + j) % 40}.5' for j in range(len(fields))))
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+def bench_influx_history():
+    """7 days of history from a Flux stand-in: the pivot-everything query decoded per record versus the lean query"""
+    import re
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import tesla_influxdb
+    full_rows = 7 * 24 * 120
+    bodies = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        # /api/v2/query: like InfluxDB it aggregates pushed-down windows and returns only the filtered fields
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            query = request['query']
+            fields = re.findall(r'r\["_field"\] == "(\w+)"', query) or tesla_influxdb.HISTORY_FIELDS
+            windowed = re.search(r'aggregateWindow\(every: (\d+)s', query)
+            count = full_rows * 30 // int(windowed.group(1)) if windowed else full_rows
+            key = (count, tuple(fields), bool(request.get('dialect', {}).get('annotations')))
+            if key not in bodies:
+                bodies[key] = flux_csv(*key)
+            body = bodies[key]
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/csv')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['INFLUXDB_URL'] = f'http://127.0.0.1:{server.server_address[1]}'
+    influx = tesla_influxdb.TeslaInfluxDB()
+
+    def legacy():
+        # The previous get_history_data: every field, every point, a dict per FluxRecord
+        query = f'''
+        from(bucket: "{influx.bucket}")
+            |> range(start: -168h)
+            |> filter(fn: (r) => r["_measurement"] == "tesla_vehicle")
+            |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
+        '''
+        points = []
+        for table in influx.query_api.query(query):
+            for record in table.records:
+                points.append({'timestamp': record.get_time(),
+                               **{field: record.values.get(field) for field in tesla_influxdb.HISTORY_FIELDS}})
+        return points
+
+    def columnar():
+        return influx.get_history_data(hours=168, max_points=0)
+
+    def lean():
+        return influx.get_history_data(hours=168, fields=['battery_level', 'speed_kmh'])
+
+    assert len(legacy()) == len(columnar()['timestamps']) == full_rows
+    report(f'influx history decode, {full_rows} rows x {len(tesla_influxdb.HISTORY_FIELDS)} fields', measure(legacy), measure(columnar))
+    report('influx history, 7 days of 2 fields at 1000 points (aggregated by the stand-in)', measure(legacy), measure(lean))
+    print(f"  points : {len(lean()['timestamps'])} per field")
+    influx.close()
+    server.shutdown()
+    del os.environ['INFLUXDB_URL']
+
+# Seconds a gunicorn worker may take to import the app and join ingestion
+STARTUP_BUDGET_SECONDS = 2.0
+
+# Runs in a fresh interpreter: every outbound connect is recorded and refused, as on a host with no network
+STARTUP_PROBE = """
+import socket, sys, threading, time
+connects = []
+def refuse(sock, address):
+    connects.append(address)
+    raise OSError('network disabled by benchmark')
+socket.socket.connect = refuse
+start = time.perf_counter()
+import tesla_vis
+imported = time.perf_counter()
+import_threads = threading.active_count()
+import_connects = len(connects)
+tesla_vis.start_ingestion_services()
+booted = time.perf_counter()
+print('STARTUP', imported - start, booted - start, import_threads, import_connects, tesla_vis.is_leader,
+      tesla_vis.GAP_THRESHOLD_MINUTES, flush=True)
+"""
+
+def bench_startup():
+    """Worker boot in a fresh interpreter: import tesla_vis, then the post-fork ingestion hook, with networking refused"""
+    import subprocess
+    workdir = tempfile.mkdtemp(prefix='tesla_vis_startup_')
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+               TESLAFI_API_TOKEN='bench-token',
+               LEADER_ELECTION='file',
+               LEADER_LOCK_FILE=os.path.join(workdir, 'ingest.lock'),
+               SPOOL_DIR=os.path.join(workdir, 'spool'),
+               # Shorter than the 30-minute asleep cadence: must be clamped to 30 + 15 minutes, not fail the import
+               GAP_THRESHOLD_MINUTES='15', GAP_MARGIN_MINUTES='15', POLL_INTERVAL_ASLEEP='1800', POLL_INTERVAL_MAX='1800')
+    env.pop('WERKZEUG_RUN_MAIN', None)
+
+    runs = []
+    for _ in range(3):
+        output = subprocess.run([sys.executable, '-c', STARTUP_PROBE], env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout
+        # Background threads print too, pick out the probe's line
+        line = next(line for line in output.splitlines() if line.startswith('STARTUP '))
+        import_time, boot_time, threads, connects, leader, gap_threshold = line.split()[1:]
+        runs.append((float(import_time), float(boot_time), int(threads), int(connects), leader == 'True', int(gap_threshold)))
+
+    import_time = min(run[0] for run in runs)
+    boot_time = min(run[1] for run in runs)
+    print(f"startup, import + post-fork hook (best of {len(runs)})")
+    print(f"  import : {import_time * 1000:9.1f} ms  threads {runs[0][2]}  connects {runs[0][3]}")
+    print(f"  boot   : {boot_time * 1000:9.1f} ms  leader {runs[0][4]}  budget {STARTUP_BUDGET_SECONDS * 1000:.0f} ms")
+    assert all(run[3] == 0 for run in runs), "importing tesla_vis opened a network connection"
+    assert all(run[2] == 1 for run in runs), "importing tesla_vis started a thread"
+    assert all(run[5] == 45 for run in runs), f"GAP_THRESHOLD_MINUTES=15 not clamped to 45 minutes: {runs[0][5]}"
+    assert boot_time < STARTUP_BUDGET_SECONDS, f"worker boot took {boot_time:.2f}s, budget is {STARTUP_BUDGET_SECONDS}s"
+
+BENCHMARKS = {
+    'charts': bench_charts,
+    'history': bench_history,
+    'binary': bench_binary,
+    'usage': bench_usage,
+    'ingest': bench_ingest,
+    'mapper': bench_mapper,
+    'http': bench_http,
+    'spool': bench_spool,
+    'compaction': bench_compaction,
+    'influx': bench_influx,
+    'influx_history': bench_influx_history,
+    'startup': bench_startup,
+}
+
+def main():
+    """Main function"""
+    names = sys.argv[1:] or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        print(f"Unknown benchmark: {', '.join(unknown)}")
+        print(f"Available: {', '.join(BENCHMARKS)}")
+        sys.exit(1)
+
+    for name in names:
+        BENCHMARKS[name]()
+
+if __name__ == '__main__':
+    main()
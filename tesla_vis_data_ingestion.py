@@ -7,16 +7,135 @@ Can be run as a standalone script or scheduled via cron/systemd.
 
 import os
 import sys
+import csv
+import gzip
 import json
 import time
+import itertools
+import multiprocessing
 import requests
 import schedule
+from collections import deque
 from datetime import datetime
 from dotenv import load_dotenv
+from tesla_vis_fields import teslafi_timestamp, tesla_record_values
+from tesla_vis_http import dashboard_client, teslafi_client
 
 # Load environment variables
 load_dotenv()
 
+# Backfill: export rows per conversion task and per database commit
+BACKFILL_CHUNK_ROWS = int(os.environ.get('BACKFILL_CHUNK_ROWS', '5000'))
+
+EXPORT_FORMATS = {'.csv': 'csv', '.json': 'json', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+def export_format(path):
+    """csv, json or ndjson from the export file name (optionally .gz)"""
+    name = path[:-3] if path.endswith('.gz') else path
+    return EXPORT_FORMATS.get(os.path.splitext(name)[1].lower())
+
+def open_export(path):
+    """Open an export as text, gunzipping .gz files on the fly"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8-sig', newline='')
+    return open(path, 'r', encoding='utf-8-sig', newline='')
+
+def iter_json_array(f, read_size=1024 * 1024):
+    """Elements of a top-level JSON array, decoded as the file is read instead of loading it whole"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    started = False
+    while True:
+        # Skip whitespace and separators, refilling the buffer as needed
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                raise ValueError('Unexpected end of JSON export')
+            chunk = f.read(read_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        if not started:
+            if buffer[pos] != '[':
+                raise ValueError('JSON export must be an array of TeslaFi records')
+            started = True
+            pos += 1
+            continue
+        if buffer[pos] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            end = None
+        # An element that runs to the end of the buffer may continue in the next read
+        if end is None or (end == len(buffer) and not eof):
+            if eof:
+                raise ValueError(f'Malformed JSON export near: {buffer[pos:pos + 80]!r}')
+            chunk = f.read(read_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield item
+        pos = end
+
+def export_items(f, fmt):
+    """(header, raw items) of an export: CSV rows, NDJSON lines or decoded JSON array elements"""
+    if fmt == 'csv':
+        reader = csv.reader(f)
+        return next(reader, []), reader
+    if fmt == 'ndjson':
+        return None, (line for line in f if line.strip())
+    return None, iter_json_array(f)
+
+def convert_backfill_chunk(fmt, header, items):
+    """Worker: raw export items to TeslaData column values; returns (rows, invalid count, item count)"""
+    rows = []
+    invalid = 0
+    for item in items:
+        if fmt == 'csv':
+            payload = dict(zip(header, item))
+        elif fmt == 'ndjson':
+            try:
+                payload = json.loads(item)
+            except ValueError:
+                payload = None
+        else:
+            payload = item
+        if not isinstance(payload, dict):
+            invalid += 1
+            continue
+        values = tesla_record_values(payload)
+        # History is placed by TeslaFi's own sample time, which it reports in local time
+        values['timestamp'] = teslafi_timestamp(values['date'])
+        if values['data_id'] is None or values['timestamp'] is None:
+            invalid += 1
+            continue
+        rows.append(values)
+    return rows, invalid, len(items)
+
+def load_checkpoint(path):
+    """Progress of an earlier backfill of this file, if the file is unchanged since"""
+    try:
+        with open(path + '.checkpoint') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if checkpoint.get('size') != os.path.getsize(path):
+        return None
+    return checkpoint
+
+def save_checkpoint(path, checkpoint):
+    """Write the checkpoint atomically so an interrupted run never leaves a partial one"""
+    tmp = path + '.checkpoint.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path + '.checkpoint')
+
 class TeslaDataIngester:
     def __init__(self):
         self.teslafi_token = os.environ.get('TESLAFI_API_TOKEN')
@@ -35,7 +154,7 @@ class TeslaDataIngester:
             url = f"https://www.teslafi.com/feed.php?token={self.teslafi_token}&command=lastGood"
             
             print(f"[{datetime.now()}] Fetching data from TeslaFi...")
-            response = requests.get(url, timeout=30)
+            response = teslafi_client.get(url)
             
             if response.status_code == 200:
                 data = response.json()
@@ -62,7 +181,8 @@ class TeslaDataIngester:
             ingest_url = f"{self.flask_app_url}/api/ingest"
             print(f"[{datetime.now()}] Posting to: {ingest_url}")
             
-            ingest_response = requests.post(ingest_url, json=data, timeout=30)
+            # Safe to retry, /api/ingest skips data_ids it already has
+            ingest_response = dashboard_client.post(ingest_url, json=data)
             
             print(f"[{datetime.now()}] Storage API response: {ingest_response.status_code}")
             print(f"[{datetime.now()}] Storage API headers: {dict(ingest_response.headers)}")
@@ -125,33 +245,103 @@ class TeslaDataIngester:
             schedule.run_pending()
             time.sleep(60)  # Check every minute
     
-    def export_data_to_csv(self, output_file='tesla_data_export.csv'):
-        """Export stored data to CSV for analysis"""
+    def export_data_to_csv(self, output_file='tesla_data_export.csv', days=365):
+        """Export stored data to CSV for analysis, streamed straight to disk"""
         try:
-            url = f"{self.flask_app_url}/api/data/history?days=365"  # Get last year of data
+            url = f"{self.flask_app_url}/api/data/history?days={days}&format=csv"  # Get last year of data
             
-            response = requests.get(url, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                if data:
-                    import pandas as pd
-                    df = pd.DataFrame(data)
-                    df.to_csv(output_file, index=False)
-                    print(f"[{datetime.now()}] Data exported to {output_file} ({len(data)} records)")
-                    return True
-                else:
-                    print(f"[{datetime.now()}] No data to export")
+            with dashboard_client.get(url, stream=True) as response:
+                if response.status_code != 200:
+                    print(f"[{datetime.now()}] Export failed: HTTP {response.status_code}")
                     return False
+                
+                # requests undoes the gzip transfer encoding while iterating
+                lines = 0
+                with open(output_file, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        f.write(chunk)
+                        lines += chunk.count(b'\n')
+            
+            records = max(lines - 1, 0)
+            if records:
+                print(f"[{datetime.now()}] Data exported to {output_file} ({records} records)")
+                return True
             else:
-                print(f"[{datetime.now()}] Export failed: HTTP {response.status_code}")
+                print(f"[{datetime.now()}] No data to export")
                 return False
                 
         except Exception as e:
             print(f"[{datetime.now()}] Export error: {e}")
             return False
 
+    def backfill_from_file(self, path, workers=None):
+        """Bulk-load a TeslaFi CSV/JSON/NDJSON export straight into the database, resumable from a checkpoint"""
+        fmt = export_format(path)
+        if fmt is None:
+            print(f"[{datetime.now()}] Unsupported export {path}: expected .csv, .json, .ndjson or .jsonl (optionally .gz)")
+            return False
+
+        checkpoint = load_checkpoint(path) or {
+            'size': os.path.getsize(path), 'rows': 0, 'inserted': 0, 'duplicate': 0, 'invalid': 0
+        }
+        if checkpoint['rows']:
+            print(f"[{datetime.now()}] Resuming backfill of {path} after {checkpoint['rows']} rows")
+
+        workers = workers or os.cpu_count() or 1
+        # Fork the converters before the app is imported, so they hold no database connections or threads
+        pool = multiprocessing.Pool(workers) if workers > 1 else None
+        from tesla_vis import app, store_ingest_chunk
+
+        started = time.time()
+        processed = 0
+
+        def store(result):
+            nonlocal processed
+            rows, invalid, count = result
+            inserted = store_ingest_chunk(rows) if rows else 0
+            checkpoint['rows'] += count
+            checkpoint['inserted'] += inserted
+            checkpoint['duplicate'] += len(rows) - inserted
+            checkpoint['invalid'] += invalid
+            save_checkpoint(path, checkpoint)
+            processed += count
+            rate = processed / max(time.time() - started, 1e-9)
+            print(f"[{datetime.now()}] Backfill: {checkpoint['rows']} rows, {checkpoint['inserted']} new, "
+                  f"{checkpoint['duplicate']} duplicate, {checkpoint['invalid']} invalid ({rate:.0f} rows/s)")
+
+        try:
+            with open_export(path) as f, app.app_context():
+                header, items = export_items(f, fmt)
+                # Rows stored by an earlier run are read past without converting them
+                items = itertools.islice(items, checkpoint['rows'], None)
+                pending = deque()
+                while True:
+                    chunk = list(itertools.islice(items, BACKFILL_CHUNK_ROWS))
+                    if not chunk:
+                        break
+                    if pool is None:
+                        store(convert_backfill_chunk(fmt, header, chunk))
+                        continue
+                    # Chunks convert in parallel but are stored in file order, a few ahead at most
+                    pending.append(pool.apply_async(convert_backfill_chunk, (fmt, header, chunk)))
+                    if len(pending) >= workers * 2:
+                        store(pending.popleft().get())
+                while pending:
+                    store(pending.popleft().get())
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        try:
+            os.remove(path + '.checkpoint')
+        except FileNotFoundError:
+            # An export without rows never writes a checkpoint
+            pass
+        print(f"[{datetime.now()}] Backfill of {path} completed: {checkpoint['inserted']} new records "
+              f"in {time.time() - started:.1f}s")
+        return True
+
 def main():
     """Main function"""
     if len(sys.argv) < 2:
@@ -159,6 +349,7 @@ def main():
         print("  python tesla_ingestion.py once          # Run data ingestion once")
         print("  python tesla_ingestion.py schedule      # Start scheduled ingestion")
         print("  python tesla_ingestion.py export        # Export data to CSV")
+        print("  python tesla_ingestion.py backfill FILE # Bulk-load a TeslaFi CSV/JSON export")
         sys.exit(1)
     
     command = sys.argv[1].lower()
@@ -178,6 +369,14 @@ def main():
             success = ingester.export_data_to_csv(output_file)
             sys.exit(0 if success else 1)
             
+        elif command == 'backfill':
+            if len(sys.argv) < 3:
+                print("Usage: python tesla_ingestion.py backfill FILE [WORKERS]")
+                sys.exit(1)
+            workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+            success = ingester.backfill_from_file(sys.argv[2], workers)
+            sys.exit(0 if success else 1)
+            
         else:
             print(f"Unknown command: {command}")
             sys.exit(1)
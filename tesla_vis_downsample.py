@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tesla Chart Downsampling
+Reduces long time series to a bounded number of points before they are sent to the browser
+"""
+
+import numpy as np
+
+def lttb_indices(xs, ys, threshold):
+    """Largest-Triangle-Three-Buckets: pick indices that preserve the visual shape of a continuous series"""
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+
+    # Missing values cannot form triangles, treat them as the series mean
+    missing = np.isnan(ys)
+    if missing.any():
+        ys = np.where(missing, np.nanmean(ys) if not missing.all() else 0.0, ys)
+
+    # Bucket edges for the n - 2 inner points, first and last points are always kept
+    edges = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average point of the next bucket is the third triangle vertex
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = xs[end:next_end].mean()
+        avg_y = ys[end:next_end].mean()
+
+        # Pick the point in the current bucket with the largest triangle area
+        ax, ay = xs[a], ys[a]
+        areas = np.abs((ax - avg_x) * (ys[start:end] - ay) - (ax - xs[start:end]) * (avg_y - ay))
+        a = start + int(areas.argmax())
+        indices[i + 1] = a
+
+    return indices
+
+def minmax_indices(ys, threshold):
+    """Min/max/last buckets: keep the extremes and closing value of a step series such as charging or locked state"""
+    n = len(ys)
+    if threshold >= n:
+        return np.arange(n)
+
+    ys = np.asarray(ys, dtype=np.float64)
+    buckets = max(threshold // 3, 1)
+    edges = (np.arange(buckets + 1) * (n / buckets)).astype(np.int64)
+    edges[-1] = n
+
+    indices = [np.array([0])]
+    for start, end in zip(edges[:-1], edges[1:]):
+        if start >= end:
+            continue
+        chunk = ys[start:end]
+        picks = [end - 1]
+        if not np.isnan(chunk).all():
+            picks.append(start + int(np.nanargmin(chunk)))
+            picks.append(start + int(np.nanargmax(chunk)))
+        indices.append(np.array(picks))
+
+    return np.unique(np.concatenate(indices))
+
+def downsample_indices(xs, continuous=(), step=(), max_points=None):
+    """Indices shared by all series of one chart so they keep a common label axis"""
+    n = len(xs)
+    series_count = len(continuous) + len(step)
+    if not max_points or n <= max_points or series_count == 0:
+        return np.arange(n)
+
+    # Split the budget between series so the union stays within max_points
+    per_series = max(max_points // series_count, 3)
+    picks = [lttb_indices(xs, ys, per_series) for ys in continuous]
+    picks += [minmax_indices(ys, per_series) for ys in step]
+
+    return np.unique(np.concatenate(picks))
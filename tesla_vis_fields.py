@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+TeslaFi Field Mapping
+One declarative table of TeslaFi payload keys to TeslaData columns, compiled once into flat converters
+"""
+
+import os
+import hashlib
+from datetime import datetime
+import pytz
+
+FLOAT = 'float'
+INT = 'int'
+BOOL = 'bool'
+TEXT = 'text'
+
+# Strings TeslaFi uses for true; anything else non-empty is false
+TRUE_STRINGS = frozenset(('true', '1', 'yes', 'on'))
+
+# (TeslaData column, TeslaFi key, type) in column order
+TESLAFI_FIELDS = [
+    ('data_id', 'data_id', INT),
+    ('date', 'Date', TEXT),
+    ('state', 'state', TEXT),
+    ('battery_level', 'battery_level', FLOAT),
+    ('battery_range', 'battery_range', FLOAT),
+    ('ideal_battery_range', 'ideal_battery_range', FLOAT),
+    ('est_battery_range', 'est_battery_range', FLOAT),
+    ('usable_battery_level', 'usable_battery_level', FLOAT),
+    ('charge_limit_soc', 'charge_limit_soc', FLOAT),
+    ('charging_state', 'charging_state', TEXT),
+    ('charge_rate', 'charge_rate', FLOAT),
+    ('charger_power', 'charger_power', FLOAT),
+    ('charger_voltage', 'charger_voltage', FLOAT),
+    ('charger_actual_current', 'charger_actual_current', FLOAT),
+    ('time_to_full_charge', 'time_to_full_charge', FLOAT),
+    ('charge_energy_added', 'charge_energy_added', FLOAT),
+    ('charge_miles_added_rated', 'charge_miles_added_rated', FLOAT),
+    ('inside_temp', 'inside_temp', FLOAT),
+    ('outside_temp', 'outside_temp', FLOAT),
+    ('driver_temp_setting', 'driver_temp_setting', FLOAT),
+    ('passenger_temp_setting', 'passenger_temp_setting', FLOAT),
+    ('is_climate_on', 'is_climate_on', BOOL),
+    ('is_preconditioning', 'is_preconditioning', BOOL),
+    ('latitude', 'latitude', FLOAT),
+    ('longitude', 'longitude', FLOAT),
+    ('speed', 'speed', FLOAT),
+    ('heading', 'heading', FLOAT),
+    ('odometer', 'odometer', FLOAT),
+    ('shift_state', 'shift_state', TEXT),
+    ('locked', 'locked', BOOL),
+    ('sentry_mode', 'sentry_mode', BOOL),
+    ('valet_mode', 'valet_mode', BOOL),
+    ('car_version', 'car_version', TEXT),
+    ('tpms_front_left', 'tpms_front_left', FLOAT),
+    ('tpms_front_right', 'tpms_front_right', FLOAT),
+    ('tpms_rear_left', 'tpms_rear_left', FLOAT),
+    ('tpms_rear_right', 'tpms_rear_right', FLOAT),
+    ('location', 'location', TEXT),
+    ('car_state', 'carState', TEXT),
+    ('max_range', 'maxRange', FLOAT),
+    ('sleep_number', 'sleepNumber', INT),
+    ('drive_number', 'driveNumber', INT),
+    ('charge_number', 'chargeNumber', INT),
+    ('idle_number', 'idleNumber', INT),
+]
+
+TESLAFI_COLUMNS = tuple(column for column, _, _ in TESLAFI_FIELDS)
+
+def safe_float(value):
+    """Safely convert value to float, return None if not possible"""
+    if value is None or value == '' or value == 'null':
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+def safe_int(value):
+    """Safely convert value to int, return None if not possible"""
+    if value is None or value == '' or value == 'null':
+        return None
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+def safe_bool(value):
+    """Safely convert value to bool, return None if not possible"""
+    if value is None or value == '' or value == 'null':
+        return None
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return value.lower() in TRUE_STRINGS
+    return bool(value)
+
+# Inline source per type: the same results as the safe_* functions, without a call per field
+COERCE_SOURCE = {
+    FLOAT: """\
+    if {v} is None or {v} == '' or {v} == 'null':
+        {v} = None
+    else:
+        try:
+            {v} = float({v})
+        except (ValueError, TypeError):
+            {v} = None
+""",
+    INT: """\
+    if {v} is None or {v} == '' or {v} == 'null':
+        {v} = None
+    else:
+        try:
+            {v} = int({v})
+        except (ValueError, TypeError):
+            {v} = None
+""",
+    BOOL: """\
+    if {v} is not None and {v} is not True and {v} is not False:
+        if isinstance({v}, str):
+            {v} = None if {v} == '' or {v} == 'null' else {v}.lower() in TRUE_STRINGS
+        else:
+            {v} = bool({v})
+""",
+    TEXT: "",
+}
+
+def compile_mapper(fields):
+    """Build a converter from TeslaFi payload to a dict of column values"""
+    lines = ['def convert(data):', '    get = data.get']
+    names = []
+    for i, (column, key, kind) in enumerate(fields):
+        var = f'v{i}'
+        names.append((column, var))
+        lines.append(f'    {var} = get({key!r})')
+        lines.append(COERCE_SOURCE[kind].format(v=var).rstrip('\n'))
+
+    lines.append('    return {' + ', '.join(f'{column!r}: {var}' for column, var in names) + '}')
+
+    namespace = {'TRUE_STRINGS': TRUE_STRINGS}
+    exec('\n'.join(line for line in lines if line), namespace)
+    return namespace['convert']
+
+# TeslaData column values from one TeslaFi payload, as a dict for the ORM and bulk inserts
+tesla_record_values = compile_mapper(TESLAFI_FIELDS)
+
+# Columns that tell samples apart for run-length compaction; data_id and Date change with every sample
+RUN_IGNORED_COLUMNS = frozenset(('data_id', 'date'))
+RUN_COLUMNS = tuple(column for column in TESLAFI_COLUMNS if column not in RUN_IGNORED_COLUMNS)
+
+def sample_hash(values):
+    """Short digest of a sample's RUN_COLUMNS values; equal for samples that differ only in data_id and time"""
+    return hashlib.blake2b(repr(tuple(values[column] for column in RUN_COLUMNS)).encode(), digest_size=8).hexdigest()
+
+# TeslaFi reports Date in the account's local time
+TESLAFI_TIMEZONE = os.environ.get('TESLAFI_TIMEZONE', 'Europe/Sofia')
+
+def timestamp_parser(tz_name):
+    """Parser from a TeslaFi Date string to a naive UTC datetime (None if unparsable)"""
+    tz = pytz.timezone(tz_name)
+    offsets = {}
+
+    def parse(date):
+        if not date:
+            return None
+        try:
+            local = datetime.fromisoformat(date)
+        except (ValueError, TypeError):
+            return None
+        if local.tzinfo is not None:
+            return local.astimezone(pytz.utc).replace(tzinfo=None)
+        # The UTC offset only changes on the hour, so resolve it once per local hour
+        hour = local.replace(minute=0, second=0, microsecond=0)
+        offset = offsets.get(hour)
+        if offset is None:
+            offset = offsets[hour] = tz.localize(hour, is_dst=False).utcoffset()
+        return local - offset
+
+    return parse
+
+teslafi_timestamp = timestamp_parser(TESLAFI_TIMEZONE)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Tesla HTTP Client
+Shared keep-alive sessions with tuned timeouts, jittered retries and a circuit breaker per upstream
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+
+# (connect, read) seconds; connect slightly above a multiple of 3s, the TCP retransmit window
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '3.05'))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '20'))
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', '3'))
+HTTP_BACKOFF_BASE = 0.5
+HTTP_BACKOFF_MAX = 8.0
+
+# Consecutive failed requests that open the breaker, and seconds before a trial request is let through
+BREAKER_THRESHOLD = int(os.environ.get('HTTP_BREAKER_THRESHOLD', '5'))
+BREAKER_COOLDOWN = float(os.environ.get('HTTP_BREAKER_COOLDOWN', '60'))
+
+# Statuses worth another attempt; they also count against the breaker
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class CircuitOpenError(requests.RequestException):
+    """Raised without sending anything while the upstream's breaker is open"""
+
+class CircuitBreaker:
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return 'closed'
+            return 'half-open' if time.monotonic() - self.opened_at >= self.cooldown else 'open'
+
+    def allow(self):
+        """Whether a request may go out; after the cooldown exactly one trial request is allowed"""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self.trial:
+                return False
+            self.trial = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                # A failed trial (or too many failures) starts a new cooldown
+                self.opened_at = time.monotonic()
+            self.trial = False
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff, so clients that failed together don't retry together"""
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+def retry_after(response):
+    """Seconds from a numeric Retry-After header, capped at the backoff maximum"""
+    try:
+        return min(float(response.headers.get('Retry-After')), HTTP_BACKOFF_MAX)
+    except (TypeError, ValueError):
+        return None
+
+class HttpClient:
+    def __init__(self, name, pool_size=4, retries=HTTP_RETRIES,
+                 timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)):
+        self.name = name
+        self.retries = retries
+        self.timeout = timeout
+        self.breaker = CircuitBreaker()
+        self.session = requests.Session()
+        # Retries are handled here (with jitter and the breaker), not by urllib3
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.lock = threading.Lock()
+        self.counters = {'requests': 0, 'errors': 0, 'retries': 0, 'rejected': 0}
+        self.latencies = deque(maxlen=200)
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def request(self, method, url, retry=True, **kwargs):
+        """Send a request, retrying connection errors, timeouts and RETRY_STATUSES with backoff"""
+        kwargs.setdefault('timeout', self.timeout)
+        attempts = self.retries + 1 if retry else 1
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                self.count('rejected')
+                raise CircuitOpenError(f"{self.name}: circuit open after repeated failures, not sending request")
+
+            self.count('requests')
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self.count('errors')
+                self.breaker.record_failure()
+                if attempt == attempts - 1:
+                    raise
+                delay = backoff_delay(attempt)
+            except Exception:
+                # Not retried, but it still counts as a failure and ends a half-open trial
+                self.count('errors')
+                self.breaker.record_failure()
+                raise
+            else:
+                with self.lock:
+                    self.latencies.append(time.perf_counter() - start)
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    return response
+                self.count('errors')
+                self.breaker.record_failure()
+                if attempt == attempts - 1:
+                    return response
+                delay = retry_after(response) or backoff_delay(attempt)
+                response.close()
+
+            self.count('retries')
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """Request, error and retry counters, breaker state and recent latency percentiles in ms"""
+        with self.lock:
+            counters = dict(self.counters)
+            latencies = sorted(self.latencies)
+        latency = None
+        if latencies:
+            pick = lambda q: round(latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000, 1)
+            latency = {'p50': pick(0.5), 'p95': pick(0.95), 'max': pick(1.0), 'samples': len(latencies)}
+        return dict(counters, breaker=self.breaker.state(), latency_ms=latency)
+
+# TeslaFi feed (lastGood and history), shared by the scheduler and the ingestion script
+teslafi_client = HttpClient('teslafi')
+
+# The dashboard's own API, used by the ingestion script to post samples and export history
+dashboard_client = HttpClient('dashboard')
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tesla Ingestion Leader Election
+Lets exactly one process poll TeslaFi: a file lock on a single host, or a lease row in the shared database
+"""
+
+import os
+import fcntl
+import socket
+from datetime import datetime, timedelta
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+def process_id():
+    """host:pid of the calling process, as recorded by whichever lease it holds"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class FileLease:
+    """flock on a local file; the OS drops it the moment the holding process dies"""
+    kind = 'file'
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self.pid = None
+
+    def acquire(self):
+        """Take the lock if it is free; True while this process holds it"""
+        if self.fd is not None and self.pid != os.getpid():
+            # Inherited across a fork: the parent owns the lock, this process does not
+            os.close(self.fd)
+            self.fd = None
+        if self.fd is not None:
+            return True
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, process_id().encode())
+        self.fd = fd
+        self.pid = os.getpid()
+        return True
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+    def holder(self):
+        """Process that last took the lock"""
+        try:
+            with open(self.path) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+class DatabaseLease:
+    """Named row with holder and expiry; taken when expired, renewed by its holder before it expires"""
+    kind = 'database'
+
+    def __init__(self, db, model, name='ingest', ttl=60):
+        self.db = db
+        self.model = model
+        self.name = name
+        self.ttl = timedelta(seconds=ttl)
+        self.table_checked = False
+
+    def acquire(self):
+        """Take the lease if it is free or expired, or renew it if held; True while this process holds it"""
+        session = self.db.session
+        if not self.table_checked:
+            self.model.__table__.create(bind=self.db.engine, checkfirst=True)
+            self.table_checked = True
+
+        model = self.model
+        me = process_id()
+        now = datetime.utcnow()
+        # One conditional UPDATE, so two contenders can never both see the lease as theirs
+        result = session.execute(
+            update(model).where(model.name == self.name, or_(model.holder == me, model.expires_at < now))
+            .values(holder=me, expires_at=now + self.ttl)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            session.commit()
+            return True
+        if session.get(model, self.name) is not None:
+            session.rollback()
+            return False
+
+        # First election: creating the row takes the lease, the primary key settles a race
+        try:
+            session.add(model(name=self.name, holder=me, expires_at=now + self.ttl))
+            session.commit()
+            return True
+        except IntegrityError:
+            session.rollback()
+            return False
+
+    def release(self):
+        model = self.model
+        self.db.session.execute(
+            update(model).where(model.name == self.name, model.holder == process_id())
+            .values(expires_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        self.db.session.commit()
+
+    def holder(self):
+        """Process holding an unexpired lease, if any"""
+        row = self.db.session.get(self.model, self.name)
+        if row is None or row.expires_at < datetime.utcnow():
+            return None
+        return row.holder
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Tesla Polling Policy
+Picks the next TeslaFi poll interval from the newest sample's state codes
+"""
+
+import os
+import math
+from datetime import datetime
+from tesla_vis_states import CarState, ChargingState, ShiftState, VehicleState
+
+POLL_MODES = ['driving', 'charging', 'idle', 'asleep', 'unknown']
+
+# Seconds between polls per mode; 'unknown' is used before any data and after failed polls
+DEFAULT_POLL_INTERVALS = {
+    'driving': 30,
+    'charging': 30,
+    'idle': 300,
+    'asleep': 1800,
+    'unknown': 300,
+}
+
+DRIVING_SHIFT_STATES = {ShiftState.DRIVE, ShiftState.REVERSE}
+ACTIVE_CHARGING_STATES = {ChargingState.STARTING, ChargingState.CHARGING}
+ASLEEP_VEHICLE_STATES = {VehicleState.ASLEEP, VehicleState.OFFLINE}
+
+class PollPolicy:
+    def __init__(self, intervals=None, min_interval=15, max_interval=3600):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        merged = dict(DEFAULT_POLL_INTERVALS, **(intervals or {}))
+        self.intervals = {mode: min(max(seconds, min_interval), max_interval) for mode, seconds in merged.items()}
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        """Policy with POLL_INTERVAL_<MODE> overrides, clamped to POLL_INTERVAL_MIN..POLL_INTERVAL_MAX seconds"""
+        intervals = {
+            mode: int(environ[f'POLL_INTERVAL_{mode.upper()}'])
+            for mode in POLL_MODES if f'POLL_INTERVAL_{mode.upper()}' in environ
+        }
+        return cls(intervals, int(environ.get('POLL_INTERVAL_MIN', '15')), int(environ.get('POLL_INTERVAL_MAX', '3600')))
+
+    def mode(self, sample):
+        """Polling mode for a sample's state codes (a mapping with the *_code columns), or 'unknown'"""
+        if sample is None:
+            return 'unknown'
+        if sample['shift_state_code'] in DRIVING_SHIFT_STATES or sample['car_state_code'] == CarState.DRIVING:
+            return 'driving'
+        if sample['charging_state_code'] in ACTIVE_CHARGING_STATES or sample['car_state_code'] == CarState.CHARGING:
+            return 'charging'
+        if sample['state_code'] in ASLEEP_VEHICLE_STATES or sample['car_state_code'] == CarState.SLEEPING:
+            return 'asleep'
+        return 'idle'
+
+    def clamp_gap_threshold(self, minutes, slack_minutes):
+        """A fixed gap threshold, raised to the longest poll interval plus slack if it is shorter than that interval
+
+        Below the longest interval, every regular poll in that mode would be recorded as a gap.
+        """
+        longest = max(self.intervals.values())
+        if minutes * 60 > longest:
+            return minutes
+        return math.ceil(longest / 60) + slack_minutes
+
+    def next_poll(self, sample):
+        """(mode, interval in seconds) for the poll after this sample"""
+        mode = self.mode(sample)
+        return mode, self.intervals[mode]
+
+def next_boundary(now, seconds):
+    """Next wall-clock multiple of the interval after now, so a 300 s cadence lands on :00, :05, ..."""
+    return datetime.fromtimestamp((int(now.timestamp()) // seconds + 1) * seconds)
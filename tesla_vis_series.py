@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Tesla Chart Series Columns
+Column-oriented helpers for chart queries: epoch-ms timestamps, bulk label formatting and JSON output
+"""
+
+import json
+from datetime import datetime, timezone
+import numpy as np
+
+MS_PER_HOUR = 3_600_000
+
+def epoch_ms(timestamps):
+    """Naive UTC datetimes (or ISO strings as stored by SQLite) to an int64 epoch-ms array"""
+    return np.array(timestamps, dtype='datetime64[ms]').astype(np.int64)
+
+def utc_offsets_ms(hours, tz):
+    """UTC offset in ms of the given pytz timezone for each whole UTC hour (sorted, unique)"""
+    def offset(hour):
+        local = datetime.fromtimestamp(int(hour) * 3600, tz=timezone.utc).astimezone(tz)
+        return int(local.utcoffset().total_seconds() * 1000)
+
+    # Resolve one offset per day, then per hour only on days that contain a DST transition
+    days = hours // 24
+    edges = np.union1d(days, days + 1)
+    edge_offsets = np.array([offset(day * 24) for day in edges], dtype=np.int64)
+    offsets = edge_offsets[np.searchsorted(edges, days)]
+
+    changing = edges[:-1][(edge_offsets[:-1] != edge_offsets[1:]) & (np.diff(edges) == 1)]
+    mask = np.isin(days, changing)
+    if mask.any():
+        offsets[mask] = [offset(hour) for hour in hours[mask]]
+    return offsets
+
+def local_labels(ms, tz, fmt_unit='m'):
+    """Format epoch-ms timestamps as 'YYYY-MM-DD HH:MM' in the given pytz timezone, in bulk"""
+    if len(ms) == 0:
+        return []
+
+    # Offsets only change on whole UTC hours
+    hours, inverse = np.unique(ms // MS_PER_HOUR, return_inverse=True)
+    local = (ms + utc_offsets_ms(hours, tz)[inverse]).astype('datetime64[ms]').astype(f'datetime64[{fmt_unit}]')
+    return np.char.replace(np.datetime_as_string(local, unit=fmt_unit), 'T', ' ').tolist()
+
+def column_array(values, numeric=True):
+    """Fetched column values to a NumPy array; numeric columns become float64 with NaN for NULL"""
+    if numeric:
+        return np.array(values, dtype=np.float64)
+    return np.array(values, dtype=object)
+
+def expand_runs(ms, until, arrays, start_ms, end_ms):
+    """Run-length rows back to step series: each run gets a second point with its values at valid_until
+
+    until holds each row's valid_until (None for single samples). Both ends are clipped to the range, so a
+    run that started before start_ms contributes a point at start_ms.
+    """
+    until = np.array(until, dtype='datetime64[ms]')
+    ms = np.maximum(ms, start_ms)
+    runs = ~np.isnat(until)
+    until_ms = np.minimum(np.where(runs, until.astype(np.int64), 0), end_ms)
+    runs &= until_ms > ms
+    if not runs.any():
+        return ms, arrays
+
+    counts = 1 + runs
+    indices = np.repeat(np.arange(len(ms)), counts)
+    ends = np.cumsum(counts)[runs] - 1
+    expanded = ms[indices]
+    expanded[ends] = until_ms[runs]
+    return expanded, {column: values[indices] for column, values in arrays.items()}
+
+def to_json_list(values):
+    """NumPy series to a JSON-ready list with None for missing values"""
+    if values.dtype.kind == 'f':
+        return np.where(np.isnan(values), None, values).tolist()
+    return values.tolist()
+
+# Binary chart block: b'TVB1', uint32 header length, JSON header (space padded to an 8-byte boundary),
+# then count int64 epoch-ms timestamps and one float32 column per series (NaN for missing),
+# all little-endian and zero padded to 8 bytes so blocks can be concatenated
+CHART_BINARY_MAGIC = b'TVB1'
+CHART_BINARY_MIMETYPE = 'application/vnd.teslavis.columns'
+
+def pad8(length):
+    return -length % 8
+
+def pack_chart_block(metric, ms, series, cursor=None):
+    """Encode one metric's timestamps and series as a binary chart block"""
+    header = json.dumps({'metric': metric, 'count': len(ms), 'series': list(series), 'cursor': cursor}).encode('utf-8')
+    header += b' ' * pad8(8 + len(header))
+
+    parts = [CHART_BINARY_MAGIC, np.uint32(len(header)).astype('<u4').tobytes(), header,
+             np.asarray(ms, dtype='<i8').tobytes()]
+    for values in series.values():
+        parts.append(np.asarray(values, dtype='<f4').tobytes())
+    body = b''.join(parts)
+    return body + b'\0' * pad8(len(body))
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Tesla Ingest Spool
+Append-only segment files that hold fetched payloads on disk until the single database writer has committed them
+"""
+
+import os
+import json
+import fcntl
+import threading
+import time
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.ndjson'
+OFFSET_FILE = 'committed.offset'
+APPEND_LOCK_FILE = 'append.lock'
+DEAD_LETTER_FILE = 'dead-letter.ndjson'
+
+def segment_name(seq):
+    return f"{SEGMENT_PREFIX}{seq:08d}{SEGMENT_SUFFIX}"
+
+class Spool:
+    """Entries are appended as JSON lines to the newest segment; positions are (segment, byte offset) tuples"""
+
+    def __init__(self, directory, segment_bytes=4 * 1024 * 1024, fsync=True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.created = False
+        # Notified whenever this process commits, so waiters don't have to poll the offset file
+        self.committed_changed = threading.Condition()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def ensure_directory(self):
+        if not self.created:
+            os.makedirs(self.directory, exist_ok=True)
+            self.created = True
+
+    def segments(self):
+        """Sequence numbers of the segment files on disk, oldest first"""
+        self.ensure_directory()
+        return sorted(
+            int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def append(self, entries):
+        """Durably append entries (JSON-serializable) in one write; returns the position just past them"""
+        data = ''.join(json.dumps(entry, separators=(',', ':'), default=str) + '\n' for entry in entries).encode()
+        self.ensure_directory()
+        # Appenders in every process on this host take turns, so each batch lands whole and rotation is decided once
+        lock_fd = os.open(self.path(APPEND_LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            segments = self.segments()
+            seq = segments[-1] if segments else 1
+            if segments and os.path.getsize(self.path(segment_name(seq))) >= self.segment_bytes:
+                seq += 1
+            fd = os.open(self.path(segment_name(seq)), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                if self.fsync:
+                    os.fsync(fd)
+                end = os.lseek(fd, 0, os.SEEK_END)
+            finally:
+                os.close(fd)
+        finally:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+        return seq, end
+
+    def committed(self):
+        """Position up to which entries have been committed to the database"""
+        try:
+            with open(self.path(OFFSET_FILE)) as f:
+                seq, offset = f.read().split()
+                return int(seq), int(offset)
+        except (OSError, ValueError):
+            segments = self.segments()
+            return (segments[0] if segments else 1), 0
+
+    def read(self, limit):
+        """Up to `limit` complete entries after the committed position, and the position just past them
+
+        Lines that are not valid JSON (a torn write from a crash) are returned as None so they can be skipped.
+        """
+        seq, offset = self.committed()
+        entries = []
+        # Only the newest segment can still grow; when an older one runs out, reading continues in the next
+        for current in [s for s in self.segments() if s >= seq]:
+            if current != seq:
+                seq, offset = current, 0
+            try:
+                with open(self.path(segment_name(seq)), 'rb') as f:
+                    f.seek(offset)
+                    while len(entries) < limit:
+                        line = f.readline()
+                        if not line.endswith(b'\n'):
+                            break
+                        offset += len(line)
+                        try:
+                            entries.append(json.loads(line))
+                        except ValueError:
+                            entries.append(None)
+            except FileNotFoundError:
+                pass
+            if len(entries) >= limit:
+                break
+        return entries, (seq, offset)
+
+    def commit(self, position):
+        """Record that everything before position is in the database and delete fully consumed segments"""
+        seq, offset = position
+        temp = self.path(OFFSET_FILE + '.tmp')
+        with open(temp, 'w') as f:
+            f.write(f"{seq} {offset}")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(temp, self.path(OFFSET_FILE))
+        for old in self.segments():
+            if old < seq:
+                try:
+                    os.remove(self.path(segment_name(old)))
+                except FileNotFoundError:
+                    pass
+        with self.committed_changed:
+            self.committed_changed.notify_all()
+
+    def dead_letter(self, failures):
+        """Set (entry, error) pairs aside in the dead-letter file, so they no longer hold up the entries after them"""
+        data = ''.join(
+            json.dumps({"error": str(error)[:500], "entry": entry}, separators=(',', ':'), default=str) + '\n'
+            for entry, error in failures
+        ).encode()
+        self.ensure_directory()
+        fd = os.open(self.path(DEAD_LETTER_FILE), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            if self.fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def wait(self, position, timeout):
+        """Block until the entries before position are committed (by any process); False on timeout"""
+        deadline = time.monotonic() + timeout
+        with self.committed_changed:
+            while self.committed() < position:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                # Short waits, so a commit made by another process's writer is noticed too
+                self.committed_changed.wait(min(remaining, 0.1))
+        return True
+
+    def stats(self):
+        """Segment count, uncommitted bytes, committed position and dead-lettered bytes"""
+        seq, offset = self.committed()
+        backlog = 0
+        segments = self.segments()
+        for s in segments:
+            if s >= seq:
+                try:
+                    backlog += os.path.getsize(self.path(segment_name(s))) - (offset if s == seq else 0)
+                except FileNotFoundError:
+                    pass
+        try:
+            dead_letter = os.path.getsize(self.path(DEAD_LETTER_FILE))
+        except FileNotFoundError:
+            dead_letter = 0
+        return {"directory": self.directory, "segments": len(segments), "backlog_bytes": max(backlog, 0),
+                "committed": [seq, offset], "dead_letter_bytes": dead_letter}
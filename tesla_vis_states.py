@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tesla State Codes
+Small-integer codes for the TeslaFi state strings, computed once at ingest so queries compare integers
+"""
+
+from enum import IntEnum
+from sqlalchemy import case, func
+
+class ChargingState(IntEnum):
+    UNKNOWN = 0
+    DISCONNECTED = 1
+    STOPPED = 2
+    STARTING = 3
+    CHARGING = 4
+    COMPLETE = 5
+    NO_POWER = 6
+
+class ShiftState(IntEnum):
+    UNKNOWN = 0
+    PARK = 1
+    REVERSE = 2
+    NEUTRAL = 3
+    DRIVE = 4
+
+class VehicleState(IntEnum):
+    UNKNOWN = 0
+    ONLINE = 1
+    ASLEEP = 2
+    OFFLINE = 3
+    WAKING = 4
+
+class CarState(IntEnum):
+    UNKNOWN = 0
+    IDLING = 1
+    DRIVING = 2
+    CHARGING = 3
+    SLEEPING = 4
+    SENTRY = 5
+
+# Lowercased TeslaFi strings per code; anything else (or missing) is UNKNOWN
+CHARGING_STATE_NAMES = {
+    'disconnected': ChargingState.DISCONNECTED,
+    'stopped': ChargingState.STOPPED,
+    'starting': ChargingState.STARTING,
+    'charging': ChargingState.CHARGING,
+    'complete': ChargingState.COMPLETE,
+    'nopower': ChargingState.NO_POWER,
+}
+
+SHIFT_STATE_NAMES = {
+    'p': ShiftState.PARK,
+    'r': ShiftState.REVERSE,
+    'n': ShiftState.NEUTRAL,
+    'd': ShiftState.DRIVE,
+}
+
+VEHICLE_STATE_NAMES = {
+    'online': VehicleState.ONLINE,
+    'asleep': VehicleState.ASLEEP,
+    'sleeping': VehicleState.ASLEEP,
+    'offline': VehicleState.OFFLINE,
+    'waking': VehicleState.WAKING,
+}
+
+CAR_STATE_NAMES = {
+    'idling': CarState.IDLING,
+    'idle': CarState.IDLING,
+    'driving': CarState.DRIVING,
+    'charging': CarState.CHARGING,
+    'sleeping': CarState.SLEEPING,
+    'sentry': CarState.SENTRY,
+}
+
+# Charging states in which the car is plugged in and taking (or done taking) a charge
+PLUGGED_IN_STATES = [ChargingState.STARTING, ChargingState.CHARGING, ChargingState.COMPLETE]
+
+def state_code(names, value):
+    """Code of a TeslaFi state string"""
+    if not value:
+        return 0
+    return int(names.get(value.strip().lower(), 0))
+
+def state_code_expression(names, column):
+    """The same lookup as a SQL CASE, for migrating rows stored before the code columns existed"""
+    return case({name: int(code) for name, code in names.items()}, value=func.lower(func.trim(column)), else_=0)
+
+def state_code_default(names, source):
+    """Column default that derives the code from the string column in the same INSERT"""
+    def default(context):
+        return state_code(names, context.get_current_parameters().get(source))
+    return default
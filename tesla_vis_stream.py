@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Tesla Live Update Broadcaster
+Fans out Server-Sent Events from one publisher to every connected client of this process
+"""
+
+import queue
+import threading
+
+class Broadcaster:
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        """Queue that receives (event, data) tuples, and None when the subscriber is dropped"""
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscribers)
+
+    def publish(self, event, data):
+        """Queue an event for every subscriber without blocking the publisher"""
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event, data))
+            except queue.Full:
+                # A client that stopped reading is dropped, it reconnects and gets a fresh snapshot
+                self.unsubscribe(subscriber)
+                self.drop(subscriber)
+
+    def drop(self, subscriber):
+        """Replace whatever a dropped subscriber has queued with the None sentinel"""
+        # The consumer thread and other publishers touch the queue concurrently, never check then act
+        while True:
+            try:
+                subscriber.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            subscriber.put_nowait(None)
+        except queue.Full:
+            pass
+
+def format_event(event, data):
+    """One Server-Sent Events message, data must be a single line"""
+    return f"event: {event}\ndata: {data}\n\n"